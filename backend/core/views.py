@@ -13,7 +13,7 @@ from core.serializers import AddressSerializer
 from django.views.decorators.http import require_POST
 
 from honey_api.views import get_orders
-from mongodb_connector import mongodb
+from honey_api.mongo_models import user_stats
 
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
@@ -96,14 +96,15 @@ def profile(request):
     try:
         addresses = Address.objects.filter(user=request.user)
         addresses_list = AddressSerializer(addresses, many=True).data
-        reviews = list(mongodb.database['reviews'].find({"user_id": request.user.id}))
-        total_spend, orders = get_orders(request)
+        stats = user_stats.get_stats(request.user.id)
+        orders = get_orders(request, stats)
 
         context = {
             'addresses': addresses_list,
             'orders': orders,
-            'total_spend': total_spend,
-            'reviews_count': len(reviews)
+            'total_spend': stats['total_spend'],
+            'orders_count': stats['order_count'],
+            'reviews_count': stats['review_count']
         }
 
         return render(request, 'profile.html', context)
@@ -0,0 +1,191 @@
+from datetime import datetime
+
+from django.utils import timezone
+from django.utils.http import http_date
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import conditional_page
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+
+from core.models import User
+from mongodb_connector import mongodb
+from honey_api.catalog_cache import get_categories, get_category_by_slug, get_product
+from honey_api.loaders import get_product_loader
+from honey_api.mongo_models import carts, orders
+from honey_api.pagination import KeysetPage
+from honey_api.search import ProductSearch
+from honey_api.serializer import (
+    REVIEW_PROJECTION, DocumentSerializer, cart_serializer, category_document_serializer, order_serializer,
+    product_document_serializer,
+)
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+PRODUCT_FIELDS = (
+    'id', 'title', 'slug', 'price', 'description', 'category_id', 'category_name', 'status', 'images',
+    'rating', 'review_count', 'rating_histogram', 'modified_at',
+)
+PRODUCT_SORT_FIELDS = ('title', 'price', 'rating', 'modified_at')
+PRODUCT_PROJECTION = {field: 1 for field in PRODUCT_FIELDS if field != 'id'}
+CATEGORY_FIELDS = ('id', 'name', 'slug', 'description', 'parent_id')
+REVIEW_FIELDS = ('id', 'username', 'rating', 'comment', 'date')
+
+review_document_serializer = DocumentSerializer()
+
+
+def api_endpoint(view):
+    # Compressed, with an ETag over the body so clients can revalidate for a 304.
+    return gzip_page(conditional_page(view))
+
+
+def requested_fields(request, allowed):
+    fields = request.query_params.get('fields')
+    if not fields:
+        return None
+
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = sorted(set(fields) - set(allowed))
+    if unknown:
+        raise ValidationError({'fields': f"Unknown fields: {', '.join(unknown)}"})
+    return fields
+
+
+def projection_for(fields, default, *required):
+    if fields is None:
+        return default
+    projection = {field: 1 for field in fields if field != 'id'}
+    projection.update({field: 1 for field in required})
+    return projection
+
+
+def sparse(documents, fields):
+    if fields is None:
+        return documents
+    return [{key: value for key, value in document.items() if key in fields} for document in documents]
+
+
+def page_size(request):
+    try:
+        size = int(request.query_params.get('page_size', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValidationError({'page_size': 'Must be an integer.'})
+    return min(max(size, 1), MAX_PAGE_SIZE)
+
+
+def paginated(page, fields):
+    return {
+        'results': sparse(page.object_list, fields),
+        'next_cursor': page.next_cursor,
+        'has_next': page.has_next,
+    }
+
+
+@api_endpoint
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def category_list(request):
+    fields = requested_fields(request, CATEGORY_FIELDS)
+    return Response({'results': sparse(category_document_serializer.many(get_categories()), fields)})
+
+
+@api_endpoint
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def product_list(request):
+    fields = requested_fields(request, PRODUCT_FIELDS)
+
+    filters = {}
+    category_slug = request.query_params.get('category')
+    if category_slug:
+        category = get_category_by_slug(category_slug)
+        if category is None:
+            raise ValidationError({'category': f"Unknown category {category_slug!r}"})
+        filters['category_id'] = category['_id']
+
+    modified_since = request.query_params.get('modified_since')
+    if modified_since:
+        try:
+            since = datetime.fromisoformat(modified_since)
+        except ValueError:
+            raise ValidationError({'modified_since': 'Must be an ISO 8601 date or datetime.'})
+        # modified_at is stored as naive local time; a naive value is taken to be the same.
+        if timezone.is_aware(since):
+            since = timezone.make_naive(since, timezone.get_default_timezone())
+        filters['modified_at'] = {'$gte': since}
+
+    sort = request.query_params.get('sort', 'title')
+    sort_field = sort.lstrip('-')
+    if sort_field not in PRODUCT_SORT_FIELDS:
+        raise ValidationError({'sort': f"Sort by one of {', '.join(PRODUCT_SORT_FIELDS)}"})
+
+    search = ProductSearch(request.query_params.get('q'), filters)
+    page = KeysetPage(
+        mongodb.database['products'], search.filters, sort_field, -1 if sort.startswith('-') else 1,
+        page_size(request), cursor=request.query_params.get('cursor'),
+        projection=projection_for(fields, PRODUCT_PROJECTION, sort_field),
+        serializer=product_document_serializer.many,
+    )
+    return Response(paginated(page, fields))
+
+
+@api_endpoint
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def product_detail(request, slug):
+    fields = requested_fields(request, PRODUCT_FIELDS)
+    product = get_product(slug)
+    if product is None:
+        raise NotFound(f"No product {slug!r}")
+
+    data = product_document_serializer({key: product[key] for key in ('_id', *PRODUCT_PROJECTION) if key in product})
+    response = Response(sparse([data], fields)[0])
+    if product.get('modified_at'):
+        response['Last-Modified'] = http_date(product['modified_at'].timestamp())
+    return response
+
+
+@api_endpoint
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def product_reviews(request, slug):
+    fields = requested_fields(request, REVIEW_FIELDS)
+    page = KeysetPage(
+        mongodb.database['reviews'], {'product_slug': slug}, 'date', -1,
+        page_size(request), cursor=request.query_params.get('cursor'),
+        projection=REVIEW_PROJECTION,
+        serializer=review_document_serializer.many,
+    )
+
+    users = User.objects.in_bulk({review['user_id'] for review in page.object_list})
+    for review in page.object_list:
+        user = users.get(review.pop('user_id'))
+        review['username'] = user.username if user else None
+    return Response(paginated(page, fields))
+
+
+@api_endpoint
+@api_view(['GET'])
+def cart_detail(request):
+    cart = cart_serializer(carts.get_or_empty(request.user.id), get_product_loader(request))
+    return Response({
+        'id': cart['_id'],
+        'items': cart['items'],
+        'subtotal': cart['subtotal'],
+        'shipping': cart['shipping'],
+        'tax': cart['tax'],
+        'total': cart['total'],
+    })
+
+
+@api_endpoint
+@api_view(['GET'])
+def order_list(request):
+    loader = get_product_loader(request)
+    page = orders.history(
+        request.user.id, page_size(request), cursor=request.query_params.get('cursor'),
+        serializer=lambda documents: order_serializer(documents, loader)[1],
+    )
+    return Response(paginated(page, None))
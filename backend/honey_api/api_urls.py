@@ -0,0 +1,13 @@
+from django.urls import path
+from . import api
+
+app_name = 'api'
+
+urlpatterns = [
+    path('categories/', api.category_list, name='category_list'),
+    path('products/', api.product_list, name='product_list'),
+    path('products/<slug:slug>/', api.product_detail, name='product_detail'),
+    path('products/<slug:slug>/reviews/', api.product_reviews, name='product_reviews'),
+    path('cart/', api.cart_detail, name='cart'),
+    path('orders/', api.order_list, name='order_list'),
+]
@@ -0,0 +1,28 @@
+from django.conf import settings
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+DEFAULT_SETTINGS = {
+    'cart_ttl_days': 30,
+    'order_archive_days': 365,
+}
+
+ORDER_ARCHIVE_PREFIX = 'orders_archive_'
+ORDER_ARCHIVE_INDEXES = [
+    IndexModel([('user_id', ASCENDING), ('date', DESCENDING), ('_id', DESCENDING)], name='user_date'),
+]
+
+
+def retention_settings():
+    return dict(DEFAULT_SETTINGS, **getattr(settings, 'DATA_RETENTION', {}))
+
+
+def order_archive_name(date):
+    return f"{ORDER_ARCHIVE_PREFIX}{date:%Y_%m}"
+
+
+def order_archives(database, until=None):
+    """Names of the monthly order archives, newest first, optionally none newer than `until`."""
+    names = database.list_collection_names(filter={'name': {'$regex': f'^{ORDER_ARCHIVE_PREFIX}'}})
+    if until is not None:
+        names = [name for name in names if name <= order_archive_name(until)]
+    return sorted(names, reverse=True)
@@ -0,0 +1,211 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from pymongo import ReturnDocument
+
+from mongodb_connector import mongodb
+
+DEFAULT_SETTINGS = {
+    'max_entries': 1024,
+    'timeout': 300,
+    'shared_cache': None,
+}
+
+# Cached and batch-loaded products feed pages, carts and checkout, none of which needs
+# the search index fields or the stock holds.
+PRODUCT_PROJECTION = {'search_prefixes': 0, 'reservations': 0}
+
+# One document per namespace, {'_id': namespace, 'version': n}, shared by every process.
+VERSIONS_COLLECTION = 'catalog_versions'
+# Read along with whatever namespace a request asks for first.
+SHARED_NAMESPACES = ('products', 'categories')
+
+# Versions read during the current request; see CatalogVersionMiddleware.
+request_versions = ContextVar('catalog_request_versions', default=None)
+
+
+class LRUCache:
+    """Small thread-safe LRU with per-entry expiry, local to the process."""
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class CatalogCache:
+    """
+    Two-tier read-through cache for catalog data.
+
+    Every key embeds the current version of its namespace, so bumping the
+    version on a write makes all older entries unreachable at once. The
+    versions live in MongoDB, so a bump from any worker, command or the
+    admin reaches every process. A request reads them once and keeps them
+    until it ends; outside a request they are read on every lookup.
+
+    Besides the shared namespaces, a single product has its own (see
+    `product_namespace`), for writes such as a new review that change
+    nothing but that product.
+    """
+
+    MISSING = object()
+
+    def __init__(self):
+        options = dict(DEFAULT_SETTINGS, **getattr(settings, 'CATALOG_CACHE', {}))
+        self.timeout = options['timeout']
+        self.local = LRUCache(options['max_entries'], self.timeout)
+        self.shared = caches[options['shared_cache']] if options['shared_cache'] else None
+
+    @staticmethod
+    def _versions(documents):
+        return {document['_id']: document['version'] for document in documents}
+
+    @staticmethod
+    def _query(namespaces):
+        return {'_id': {'$in': sorted({*namespaces, *SHARED_NAMESPACES})}}
+
+    @staticmethod
+    def _remember(versions, namespaces, missing, loaded):
+        loaded = {namespace: loaded.get(namespace, 0) for namespace in {*missing, *SHARED_NAMESPACES}}
+        if versions is None:
+            return tuple(loaded[namespace] for namespace in namespaces)
+        versions.update(loaded)
+        return tuple(versions[namespace] for namespace in namespaces)
+
+    def version(self, namespace):
+        return self.versions(namespace)[0]
+
+    def versions(self, *namespaces):
+        versions = request_versions.get()
+        missing = [namespace for namespace in namespaces if versions is None or namespace not in versions]
+        if not missing:
+            return tuple(versions[namespace] for namespace in namespaces)
+        loaded = self._versions(mongodb.database[VERSIONS_COLLECTION].find(self._query(missing)))
+        return self._remember(versions, namespaces, missing, loaded)
+
+    def bump(self, namespace):
+        document = mongodb.database[VERSIONS_COLLECTION].find_one_and_update(
+            {'_id': namespace}, {'$inc': {'version': 1}}, upsert=True, return_document=ReturnDocument.AFTER,
+        )
+        versions = request_versions.get()
+        if versions is not None:
+            versions[namespace] = document['version']
+
+    def get_or_set(self, namespace, key, loader):
+        cache_key = f'catalog:{namespace}:{self.version(namespace)}:{key}'
+
+        value = self.local.get(cache_key, self.MISSING)
+        if value is self.MISSING and self.shared is not None:
+            value = self.shared.get(cache_key, self.MISSING)
+            if value is not self.MISSING:
+                self.local.set(cache_key, value)
+
+        if value is self.MISSING:
+            value = loader()
+            self.local.set(cache_key, value)
+            if self.shared is not None:
+                self.shared.set(cache_key, value, self.timeout)
+
+        return copy.deepcopy(value)
+
+    async def aversion(self, namespace):
+        return (await self.aversions(namespace))[0]
+
+    async def aversions(self, *namespaces):
+        versions = request_versions.get()
+        missing = [namespace for namespace in namespaces if versions is None or namespace not in versions]
+        if not missing:
+            return tuple(versions[namespace] for namespace in namespaces)
+        cursor = mongodb.async_database[VERSIONS_COLLECTION].find(self._query(missing))
+        return self._remember(versions, namespaces, missing, self._versions(await cursor.to_list()))
+
+    async def aget_or_set(self, namespace, key, loader):
+        cache_key = f'catalog:{namespace}:{await self.aversion(namespace)}:{key}'
+
+        value = self.local.get(cache_key, self.MISSING)
+        if value is self.MISSING and self.shared is not None:
+            value = await self.shared.aget(cache_key, self.MISSING)
+            if value is not self.MISSING:
+                self.local.set(cache_key, value)
+
+        if value is self.MISSING:
+            value = await loader()
+            self.local.set(cache_key, value)
+            if self.shared is not None:
+                await self.shared.aset(cache_key, value, self.timeout)
+
+        return copy.deepcopy(value)
+
+
+catalog_cache = CatalogCache()
+
+
+def get_categories():
+    return catalog_cache.get_or_set('categories', 'all', lambda: list(mongodb.database['categories'].find()))
+
+
+def get_category(category_id):
+    for category in get_categories():
+        if category['_id'] == category_id:
+            return category
+    return None
+
+
+def get_category_by_slug(slug):
+    for category in get_categories():
+        if category['slug'] == slug:
+            return category
+    return None
+
+
+def product_namespace(slug):
+    return f'product:{slug}'
+
+
+def get_product(slug):
+    key = f'slug:{slug}:{catalog_cache.version(product_namespace(slug))}'
+    return catalog_cache.get_or_set('products', key, lambda: mongodb.database['products'].find_one({'slug': slug}, PRODUCT_PROJECTION))
+
+
+async def aget_categories():
+    async def load():
+        return await mongodb.async_database['categories'].find().to_list()
+    return await catalog_cache.aget_or_set('categories', 'all', load)
+
+
+async def aget_product(slug):
+    async def load():
+        return await mongodb.async_database['products'].find_one({'slug': slug}, PRODUCT_PROJECTION)
+    key = f'slug:{slug}:{await catalog_cache.aversion(product_namespace(slug))}'
+    return await catalog_cache.aget_or_set('products', key, load)
@@ -0,0 +1,115 @@
+from django.utils.http import urlencode
+
+# Lower bounds of the price buckets; the last one is open ended.
+PRICE_BOUNDARIES = (0, 10, 20, 30, 50)
+RATING_THRESHOLDS = (4, 3, 2, 1)
+FILTER_PARAMS = ('q', 'category', 'sort', 'price', 'rating')
+
+
+def price_buckets():
+    bounds = PRICE_BOUNDARIES + (None,)
+    return [(low, high) for low, high in zip(bounds, bounds[1:])]
+
+
+def price_value(low, high):
+    return f"{low}-{high if high is not None else ''}"
+
+
+def parse_price(value):
+    for low, high in price_buckets():
+        if price_value(low, high) == value:
+            return low, high
+    return None
+
+
+def parse_rating(value):
+    return int(value) if value in {str(threshold) for threshold in RATING_THRESHOLDS} else None
+
+
+def filter_query(params, **changes):
+    """The shop query string for `params` with `changes` applied; paging always starts over."""
+    values = {name: params.get(name) for name in FILTER_PARAMS}
+    values.update(changes)
+    return urlencode([(name, value) for name, value in values.items() if value not in (None, '')])
+
+
+class ProductFacets:
+    """
+    Sidebar counts for a product search: per category, per price bucket and
+    per minimum rating.
+
+    Each facet counts the search narrowed by every selection except its own,
+    so the other categories (or price ranges) still show what they would
+    add. All facets and the total come from a single `$facet` aggregation.
+    For a selective search it can return one page of results as well;
+    otherwise the page is better served by an indexed find.
+    """
+
+    def __init__(self, base_filters, category_id=None, price=None, rating=None):
+        self.base_filters = base_filters
+        self.selections = {}
+        if category_id is not None:
+            self.selections['category'] = {'category_id': category_id}
+        if price is not None:
+            low, high = price
+            self.selections['price'] = {'price': {'$gte': low, '$lt': high} if high is not None else {'$gte': low}}
+        if rating is not None:
+            self.selections['rating'] = {'rating': {'$gte': rating}}
+
+    @property
+    def selective(self):
+        # Sorting inside $facet uses no index, which only pays off when the
+        # search already narrows the catalog to a few documents.
+        return '$text' in self.base_filters or 'search_prefixes' in self.base_filters
+
+    def filters(self):
+        return {'$and': [self.base_filters, *self.selections.values()]} if self.selections else self.base_filters
+
+    def _narrowed(self, facet, stages):
+        selections = [selection for name, selection in self.selections.items() if name != facet]
+        return ([{'$match': {'$and': selections}}] if selections else []) + stages
+
+    def pipeline(self, sort=None, start=0, limit=None, projection=None):
+        facets = {
+            'total': self._narrowed(None, [{'$count': 'count'}]),
+            'categories': self._narrowed('category', [{'$group': {'_id': '$category_id', 'count': {'$sum': 1}}}]),
+            'prices': self._narrowed('price', [{'$bucket': {
+                'groupBy': '$price',
+                'boundaries': list(PRICE_BOUNDARIES) + [float('inf')],
+                'default': 'other',
+            }}]),
+            'ratings': self._narrowed('rating', [{'$group': {'_id': None, **{
+                str(threshold): {'$sum': {'$cond': [{'$gte': ['$rating', threshold]}, 1, 0]}}
+                for threshold in RATING_THRESHOLDS
+            }}}]),
+        }
+        if limit is not None:
+            page = [{'$sort': dict(sort)}, {'$skip': start}, {'$limit': limit}]
+            if projection:
+                page.append({'$project': projection})
+            facets['page'] = self._narrowed(None, page)
+
+        # $text may only appear in the first stage, so the search runs once for every facet.
+        return [{'$match': self.base_filters}, {'$facet': facets}]
+
+    async def arun(self, collection, **page):
+        """Runs the aggregation on an async collection; see `pipeline` for the page arguments."""
+        cursor = await collection.aggregate(self.pipeline(**page))
+        result, = await cursor.to_list(1)
+        prices = {bucket['_id']: bucket['count'] for bucket in result['prices']}
+        ratings = result['ratings'][0] if result['ratings'] else {}
+
+        counts = {
+            'total': result['total'][0]['count'] if result['total'] else 0,
+            'categories': {str(bucket['_id']): bucket['count'] for bucket in result['categories']},
+            'prices': [
+                {'low': low, 'high': high, 'value': price_value(low, high), 'count': prices.get(low, 0)}
+                for low, high in price_buckets()
+            ],
+            'ratings': [
+                {'value': threshold, 'count': ratings.get(str(threshold), 0)} for threshold in RATING_THRESHOLDS
+            ],
+        }
+        if 'page' in result:
+            counts['page'] = result['page']
+        return counts
@@ -0,0 +1,36 @@
+from django.conf import settings
+
+DEFAULT_SETTINGS = {
+    # How long the checkout page holds the cart's stock for the shopper.
+    'reservation_minutes': 10,
+    # How often `release_reservations --loop` hands lapsed holds back to stock.
+    'release_interval_seconds': 60,
+}
+
+
+def inventory_settings():
+    return dict(DEFAULT_SETTINGS, **getattr(settings, 'INVENTORY', {}))
+
+
+def reservation_is(reservation_id):
+    return {'$eq': ['$$reservation.id', reservation_id]}
+
+
+def reservation_expired(now):
+    return {'$lte': ['$$reservation.expires_at', now]}
+
+
+def release_reservations(condition):
+    """
+    Update pipeline stage that hands the quantities of the reservations
+    matching `condition` back to `stock` and drops those reservations, as
+    one write on the product document.
+    """
+    reservations = {'$ifNull': ['$reservations', []]}
+    released = {'$filter': {'input': reservations, 'as': 'reservation', 'cond': condition}}
+    return {'$set': {
+        'stock': {'$add': ['$stock', {'$sum': {'$map': {
+            'input': released, 'as': 'reservation', 'in': '$$reservation.quantity',
+        }}}]},
+        'reservations': {'$filter': {'input': reservations, 'as': 'reservation', 'cond': {'$not': [condition]}}},
+    }}
@@ -0,0 +1,40 @@
+from mongodb_connector import mongodb
+from honey_api.catalog_cache import PRODUCT_PROJECTION
+
+
+class ProductLoader:
+    """Fetches products by slug with one `$in` query and keeps them for reuse."""
+
+    def __init__(self, projection=None):
+        # Carts, checkout and orders never need the stock holds or the search index fields.
+        self.projection = PRODUCT_PROJECTION if projection is None else projection
+        self._cache = {}
+
+    def load_many(self, slugs):
+        slugs = list(slugs)
+        missing = {slug for slug in slugs if slug not in self._cache}
+
+        if missing:
+            for product in mongodb.database['products'].find({'slug': {'$in': list(missing)}}, self.projection):
+                self._cache[product['slug']] = product
+            for slug in missing:
+                self._cache.setdefault(slug, None)
+
+        return {slug: self._cache[slug] for slug in slugs}
+
+    def load(self, slug):
+        return self.load_many([slug])[slug]
+
+    def prime_cart(self, cart):
+        return self.load_many(item['product_slug'] for item in cart['items'])
+
+    def prime_orders(self, orders):
+        return self.load_many(item['product_slug'] for order in orders for item in order['items'])
+
+
+def get_product_loader(request):
+    loader = getattr(request, '_product_loader', None)
+    if loader is None:
+        loader = ProductLoader()
+        request._product_loader = loader
+    return loader
@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+
+from honey_api.archive import retention_settings
+from honey_api.mongo_models import CartManager, OrderManager
+
+
+class Command(BaseCommand):
+    help = 'Move old orders into monthly archive collections and put legacy carts under the cart TTL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, help='Defaults to DATA_RETENTION order_archive_days')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        days = options['older_than_days'] or retention_settings()['order_archive_days']
+        cutoff = datetime.now() - timedelta(days=days)
+
+        stamped = CartManager().stamp_untouched()
+        if stamped:
+            self.stdout.write(f"Stamped {stamped} carts without last_touched")
+
+        manager = OrderManager()
+        archived = 0
+        while True:
+            moved = manager.archive_before(cutoff, options['batch_size'])
+            if not moved:
+                break
+            archived += moved
+            self.stdout.write(f"Archived {archived} orders", ending='\r')
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} orders placed before {cutoff:%Y-%m-%d}"))
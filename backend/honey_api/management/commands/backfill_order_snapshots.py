@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from mongodb_connector import mongodb
+from honey_api.loaders import ProductLoader
+from honey_api.mongo_models import snapshot_order_item
+
+
+class Command(BaseCommand):
+    help = 'Store product title and price snapshots on orders created before they existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        orders = mongodb.database['orders']
+        pending = orders.find({'items': {'$elemMatch': {'title': {'$exists': False}}}}, {'items': 1})
+        loader = ProductLoader(projection={'slug': 1, 'title': 1, 'price': 1})
+        batch = []
+        updated = 0
+
+        for order in pending:
+            batch.append(order)
+            if len(batch) >= options['batch_size']:
+                updated += self.backfill(orders, loader, batch)
+                batch = []
+
+        if batch:
+            updated += self.backfill(orders, loader, batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {updated} orders"))
+
+    def backfill(self, orders, loader, batch):
+        products = loader.prime_orders(batch)
+        requests = [
+            UpdateOne({'_id': order['_id']}, {'$set': {'items': [
+                snapshot_order_item(item, products[item['product_slug']]) for item in order['items']
+            ]}})
+            for order in batch
+        ]
+        return orders.bulk_write(requests, ordered=False).modified_count
@@ -0,0 +1,91 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from mongodb_connector import mongodb
+from honey_api.archive import order_archives
+from honey_api.mongo_models import RecommendationManager
+from honey_api.pagination import seek_filter
+from honey_api.recommendations import co_purchase_counts
+
+COUNTED = {'order_status': {'$ne': 'cancelled'}}
+
+
+class Command(BaseCommand):
+    help = 'Fold new orders into the co-purchase counts and refresh the top related products'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true', help='Drop the counts and start over from the archived orders',
+        )
+        parser.add_argument('--top-k', type=int, default=8)
+        parser.add_argument('--batch-size', type=int, default=5000, help='Orders counted per round trip')
+        parser.add_argument(
+            '--overlap-minutes', type=int, default=10,
+            help='Re-read orders this much older than the checkpoint, for ones saved after newer orders',
+        )
+
+    def handle(self, *args, **options):
+        self.manager = RecommendationManager()
+        self.top_k = options['top_k']
+        self.touched = set()
+        batch_size = options['batch_size']
+        overlap = timedelta(minutes=options['overlap_minutes'])
+        processed = 0
+
+        if options['rebuild']:
+            self.manager.reset()
+            # Archives no longer change, so they are only read by a rebuild.
+            for name in order_archives(mongodb.database):
+                processed += self.count_archive(mongodb.database[name], batch_size)
+
+        # Orders are read by date, and the checkpoint keeps the ids counted
+        # within the overlap: an order whose date is older than one already
+        # counted (it was saved later) is still picked up, and only once.
+        last_date, recent = self.manager.checkpoint()
+        filters = dict(COUNTED)
+        if last_date is not None:
+            filters['date'] = {'$gte': last_date - overlap}
+
+        orders = mongodb.database['orders']
+        position = None
+        while True:
+            query = filters if position is None else {'$and': [filters, seek_filter('date', 1, *position)]}
+            batch = list(orders.find(
+                query, {'items.product_slug': 1, 'date': 1}, sort=[('date', 1), ('_id', 1)],
+            ).limit(batch_size))
+            if not batch:
+                break
+            position = (batch[-1]['date'], batch[-1]['_id'])
+
+            new = [order for order in batch if order['_id'] not in recent]
+            self.count(new)
+            processed += len(new)
+
+            # An interrupted run can count at most this one batch twice.
+            last_date = max(last_date or position[0], position[0])
+            recent.update((order['_id'], order['date']) for order in batch)
+            recent = {order_id: date for order_id, date in recent.items() if date >= last_date - overlap}
+            self.manager.save_checkpoint(last_date, recent)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Counted {processed} new orders, refreshed recommendations for {len(self.touched)} products"
+        ))
+
+    def count_archive(self, archive, batch_size):
+        processed = 0
+        last_id = None
+        while True:
+            filters = dict(COUNTED) if last_id is None else dict(COUNTED, _id={'$gt': last_id})
+            batch = list(archive.find(filters, {'items.product_slug': 1}, sort=[('_id', 1)]).limit(batch_size))
+            if not batch:
+                return processed
+            self.count(batch)
+            processed += len(batch)
+            last_id = batch[-1]['_id']
+
+    def count(self, orders):
+        counts = co_purchase_counts(orders)
+        self.manager.add_co_purchases(counts)
+        self.manager.refresh_neighbours(counts, self.top_k)
+        self.touched.update(counts)
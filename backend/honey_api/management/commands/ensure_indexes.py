@@ -0,0 +1,89 @@
+from django.core.management.base import BaseCommand
+from pymongo.errors import OperationFailure
+
+from honey_api.mongo_models import all_managers
+
+INDEX_OPTIONS = ('unique', 'sparse', 'expireAfterSeconds', 'partialFilterExpression')
+
+
+def index_matches(declared, existing):
+    declared_key = list(declared['key'].items())
+
+    # Text indexes are stored under the internal _fts/_ftsx keys, so only the
+    # name and weights can be compared.
+    if any(direction == 'text' for _, direction in declared_key):
+        return declared.get('weights') in (None, existing.get('weights'))
+
+    if declared_key != [tuple(key) for key in existing['key']]:
+        return False
+
+    return all(declared.get(option) == existing.get(option) for option in INDEX_OPTIONS)
+
+
+class Command(BaseCommand):
+    help = 'Create or reconcile the MongoDB indexes declared on each manager'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+        parser.add_argument('--drop-extra', action='store_true', help='Drop indexes that are not declared')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        failed = False
+
+        for manager in all_managers():
+            collection = manager.collection
+            existing = collection.index_information()
+            declared_names = set()
+
+            for index in manager.indexes:
+                declared = index.document
+                name = declared['name']
+                declared_names.add(name)
+
+                if name in existing:
+                    if index_matches(declared, existing[name]):
+                        continue
+                    self.stdout.write(self.style.WARNING(f"{collection.name}.{name}: definition changed, rebuilding"))
+                    if not dry_run:
+                        collection.drop_index(name)
+                else:
+                    self.stdout.write(f"{collection.name}.{name}: missing, creating")
+
+                if dry_run:
+                    continue
+
+                try:
+                    collection.create_indexes([index])
+                except OperationFailure as e:
+                    self.stdout.write(self.style.ERROR(f"{collection.name}.{name}: {e}"))
+                    failed = True
+
+            for name in existing:
+                if name == '_id_' or name in declared_names:
+                    continue
+                if options['drop_extra'] and not dry_run:
+                    collection.drop_index(name)
+                    self.stdout.write(self.style.WARNING(f"{collection.name}.{name}: not declared, dropped"))
+                else:
+                    self.stdout.write(self.style.WARNING(f"{collection.name}.{name}: not declared"))
+
+            self.report_unused(collection, declared_names)
+
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS('Dry run finished'))
+        elif failed:
+            self.stdout.write(self.style.ERROR('Some indexes could not be built, fix the data and run again'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Indexes are up to date'))
+
+    def report_unused(self, collection, declared_names):
+        try:
+            stats = list(collection.aggregate([{'$indexStats': {}}]))
+        except OperationFailure:
+            return
+
+        for stat in stats:
+            if stat['name'] in declared_names and stat['accesses']['ops'] == 0:
+                since = stat['accesses']['since']
+                self.stdout.write(f"{collection.name}.{stat['name']}: unused since {since:%Y-%m-%d %H:%M}")
@@ -0,0 +1,225 @@
+import csv
+import json
+import os
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.text import slugify
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from mongodb_connector import mongodb
+from honey_api.catalog_cache import catalog_cache
+from honey_api.mongo_models import CategoryManager, empty_rating_fields
+from honey_api.search import search_fields
+from honey_api.utils import allocate_slugs
+
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+
+
+def read_jsonl(path):
+    # Lines are decoded per row so one malformed line is reported instead of aborting the import.
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if line.strip():
+                yield line_number, line
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+CHANGED_FIELD = '_import_changed'
+
+
+def update_pipeline(entry, now):
+    """
+    Sets the row's fields and fills the insert-only ones where missing, but
+    only stamps modified_at when a value actually differs, so re-importing
+    an unchanged feed modifies nothing.
+    """
+    fields = entry['set']
+    changed = {'$or': [{'$ne': [f'${field}', {'$literal': value}]} for field, value in fields.items()]}
+    return [
+        {'$set': {CHANGED_FIELD: changed}},
+        {'$set': {
+            **{field: {'$literal': value} for field, value in fields.items()},
+            **{field: {'$ifNull': [f'${field}', {'$literal': value}]} for field, value in entry['on_insert'].items()},
+            'modified_at': {'$cond': [f'${CHANGED_FIELD}', now, '$modified_at']},
+        }},
+        {'$unset': CHANGED_FIELD},
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream products from a CSV or JSONL file and upsert them in bulk, keyed on the '
+        'sku column (new products get a fresh slug) or else on an explicit slug column'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(READERS), help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--create-categories', action='store_true', help='Create categories missing from the database')
+        parser.add_argument('--max-errors', type=int, default=50, help='How many row errors to print')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(f"Unknown format {file_format!r}, use --format")
+        if not os.path.exists(options['path']):
+            raise CommandError(f"{options['path']} does not exist")
+
+        self.verbosity = options['verbosity']
+        self.products = mongodb.database['products']
+        self.create_categories = options['create_categories']
+        self.max_errors = options['max_errors']
+        self.categories = {}
+        for category in mongodb.database['categories'].find({}, {'name': 1, 'slug': 1}):
+            self.remember_category(category)
+
+        self.created = self.updated = self.unchanged = self.failed = 0
+        started = time.perf_counter()
+        self.now = datetime.now()
+        batch, lines, keys = [], [], set()
+        rows = 0
+
+        for line_number, row in READERS[file_format](options['path']):
+            rows += 1
+            try:
+                entry = self.build_entry(row)
+            except (ValueError, TypeError) as e:
+                self.report_error(line_number, e)
+                continue
+
+            # A product twice in one unordered batch would race two upserts; flush first.
+            key = tuple(entry['filter'].items())
+            if key in keys or len(batch) >= options['batch_size']:
+                self.flush(batch, lines)
+                batch, lines, keys = [], [], set()
+                self.report_progress(rows, started)
+
+            batch.append(entry)
+            lines.append(line_number)
+            keys.add(key)
+
+        if batch:
+            self.flush(batch, lines)
+
+        if self.created or self.updated:
+            catalog_cache.bump('products')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {rows} rows in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/s): "
+            f"{self.created} created, {self.updated} updated, {self.unchanged} unchanged, {self.failed} failed"
+        ))
+
+    def remember_category(self, category):
+        self.categories[category['name'].lower()] = category
+        self.categories[category['slug']] = category
+
+    def resolve_category(self, name):
+        name = (name or '').strip()
+        if not name:
+            raise ValueError("missing category")
+
+        category = self.categories.get(name.lower()) or self.categories.get(slugify(name))
+        if category is None:
+            if not self.create_categories:
+                raise ValueError(f"unknown category {name!r}")
+            category = CategoryManager().create_category(name)
+            self.remember_category(category)
+        return category
+
+    def build_entry(self, row):
+        if isinstance(row, str):
+            row = json.loads(row)
+        if not isinstance(row, dict):
+            raise ValueError("row is not an object")
+
+        title = (row.get('title') or '').strip()
+        if not title:
+            raise ValueError("missing title")
+
+        # Titles repeat across different products, so a row is matched on the
+        # feed's own id: the SKU, or else a slug the feed chose itself.
+        sku = str(row.get('sku') or '').strip()
+        slug = slugify(row.get('slug') or '')
+        if not sku and not slug:
+            raise ValueError("missing sku or slug")
+
+        price = float(row.get('price'))
+        if price < 0:
+            raise ValueError(f"negative price {price}")
+
+        category = self.resolve_category(row.get('category'))
+
+        fields = {
+            'title': title,
+            'category_id': category['_id'],
+            'price': price,
+            'description': row.get('description') or '',
+            'status': row.get('status') or 'active',
+        }
+        fields.update(search_fields(title, category['name']))
+
+        on_insert = empty_rating_fields()
+        images = row.get('images')
+        if images:
+            fields['images'] = images.split('|') if isinstance(images, str) else list(images)
+        else:
+            on_insert['images'] = []
+
+        if sku:
+            if slug:
+                on_insert['slug'] = slug
+            return {'filter': {'sku': sku}, 'set': fields, 'on_insert': on_insert, 'needs_slug': not slug}
+        return {'filter': {'slug': slug}, 'set': fields, 'on_insert': on_insert, 'needs_slug': False}
+
+    def allocate_new_slugs(self, batch):
+        # Only SKUs new to the catalog get a slug, all of them from one counter update per title.
+        pending = [entry for entry in batch if entry['needs_slug']]
+        if not pending:
+            return
+        known = {
+            product['sku']
+            for product in self.products.find({'sku': {'$in': [entry['filter']['sku'] for entry in pending]}}, {'sku': 1})
+        }
+        new = [entry for entry in pending if entry['filter']['sku'] not in known]
+        for entry, slug in zip(new, allocate_slugs('products', [entry['set']['title'] for entry in new])):
+            entry['on_insert']['slug'] = slug
+
+    def flush(self, batch, lines):
+        self.allocate_new_slugs(batch)
+        operations = [UpdateOne(entry['filter'], update_pipeline(entry, self.now), upsert=True) for entry in batch]
+        try:
+            result = self.products.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Unordered: every other operation in the batch was still applied.
+            for error in e.details['writeErrors']:
+                self.report_error(lines[error['index']], error['errmsg'])
+            self.created += e.details['nUpserted']
+            self.updated += e.details['nModified']
+            self.unchanged += e.details['nMatched'] - e.details['nModified']
+            return
+
+        self.created += result.upserted_count
+        self.updated += result.modified_count
+        self.unchanged += result.matched_count - result.modified_count
+
+    def report_error(self, line_number, error):
+        self.failed += 1
+        if self.failed <= self.max_errors:
+            self.stderr.write(f"line {line_number}: {error}")
+        elif self.failed == self.max_errors + 1:
+            self.stderr.write("further row errors are counted but not printed")
+
+    def report_progress(self, rows, started):
+        if self.verbosity >= 2:
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{rows} rows, {rows / elapsed if elapsed else 0:.0f} rows/s")
@@ -0,0 +1,45 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from mongodb_connector import mongodb
+from honey_api.catalog_cache import catalog_cache
+from honey_api.mongo_models import RATING_VALUES, empty_rating_fields
+
+
+class Command(BaseCommand):
+    help = 'Recompute product rating aggregates from the reviews collection'
+
+    def handle(self, *args, **options):
+        # Products get their fresh aggregates first, stamped with this run, and
+        # only the unstamped ones (no reviews left) are reset afterwards, so
+        # no product shows zero ratings while the rebuild runs.
+        started = datetime.now()
+        mongodb.database['reviews'].aggregate([
+            {'$group': dict(
+                {
+                    '_id': '$product_slug',
+                    'review_count': {'$sum': 1},
+                    'rating_sum': {'$sum': '$rating'},
+                },
+                **{f'stars_{value}': {'$sum': {'$cond': [{'$eq': ['$rating', value]}, 1, 0]}} for value in RATING_VALUES}
+            )},
+            {'$project': {
+                '_id': 0,
+                'slug': '$_id',
+                'review_count': 1,
+                'rating_sum': 1,
+                'rating': {'$round': [{'$divide': ['$rating_sum', '$review_count']}, 1]},
+                'rating_histogram': {str(value): f'$stars_{value}' for value in RATING_VALUES},
+                'ratings_rebuilt_at': {'$literal': started},
+            }},
+            {'$merge': {'into': 'products', 'on': 'slug', 'whenMatched': 'merge', 'whenNotMatched': 'discard'}},
+        ])
+        mongodb.database['products'].update_many(
+            {'ratings_rebuilt_at': {'$ne': started}, 'review_count': {'$ne': 0}},
+            {'$set': dict(empty_rating_fields(), ratings_rebuilt_at=started)},
+        )
+
+        catalog_cache.bump('products')
+        rated = mongodb.database['products'].count_documents({'review_count': {'$gt': 0}})
+        self.stdout.write(self.style.SUCCESS(f"Rating aggregates rebuilt, {rated} products have reviews"))
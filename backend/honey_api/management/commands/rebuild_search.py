@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from mongodb_connector import mongodb
+from honey_api.search import search_fields
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized search fields on every product'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        category_names = {
+            category['_id']: category['name']
+            for category in mongodb.database['categories'].find({}, {'name': 1})
+        }
+
+        products = mongodb.database['products']
+        batch = []
+        updated = 0
+
+        for product in products.find({}, {'title': 1, 'category_id': 1}):
+            fields = search_fields(product['title'], category_names.get(product.get('category_id')))
+            batch.append(UpdateOne({'_id': product['_id']}, {'$set': fields}))
+
+            if len(batch) >= options['batch_size']:
+                updated += products.bulk_write(batch, ordered=False).modified_count
+                batch = []
+
+        if batch:
+            updated += products.bulk_write(batch, ordered=False).modified_count
+
+        self.stdout.write(self.style.SUCCESS(f"Search fields updated on {updated} products"))
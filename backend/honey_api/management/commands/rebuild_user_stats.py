@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from core.models import User
+from honey_api.mongo_models import UserStatsManager
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-user order and review stats from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only rebuild the stats of this user id')
+
+    def handle(self, *args, **options):
+        manager = UserStatsManager()
+        user_ids = [options['user']] if options['user'] else User.objects.values_list('id', flat=True).iterator()
+
+        rebuilt = 0
+        for user_id in user_ids:
+            manager.rebuild(user_id)
+            rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {rebuilt} users"))
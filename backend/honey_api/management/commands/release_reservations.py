@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from honey_api.inventory import inventory_settings
+from honey_api.mongo_models import ProductManager
+
+
+class Command(BaseCommand):
+    help = 'Hand the stock of lapsed checkout holds back to the products; run it from cron or with --loop'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running, every INVENTORY release_interval_seconds')
+
+    def handle(self, *args, **options):
+        manager = ProductManager()
+        interval = inventory_settings()['release_interval_seconds']
+
+        while True:
+            released = manager.release_expired()
+            self.stdout.write(f"Released lapsed reservations on {released} products")
+            if not options['loop']:
+                break
+            time.sleep(interval)
@@ -0,0 +1,41 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from honey_api.mongo_models import ProductManager
+
+
+class Command(BaseCommand):
+    help = 'Add stock to many products at once, from slug=quantity pairs or a slug,quantity CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('quantities', nargs='*', metavar='slug=quantity')
+        parser.add_argument('--file', help='CSV file with slug and quantity columns')
+        parser.add_argument('--set', dest='replace', action='store_true', help='Set the stock instead of adding to it')
+
+    def handle(self, *args, **options):
+        quantities = {}
+        try:
+            for pair in options['quantities']:
+                slug, quantity = pair.split('=', 1)
+                quantities[slug] = quantities.get(slug, 0) + int(quantity)
+
+            if options['file']:
+                with open(options['file'], newline='', encoding='utf-8-sig') as f:
+                    for row in csv.DictReader(f):
+                        quantities[row['slug']] = quantities.get(row['slug'], 0) + int(row['quantity'])
+        except (KeyError, ValueError) as e:
+            raise CommandError(f"Could not read the quantities: {e}")
+
+        if not quantities:
+            raise CommandError('Nothing to restock, pass slug=quantity pairs or --file')
+
+        manager = ProductManager()
+        released = manager.release_expired()
+        matched = manager.restock(quantities, replace=options['replace'])
+
+        if released:
+            self.stdout.write(f"Released lapsed reservations on {released} products")
+        if matched < len(quantities):
+            self.stdout.write(self.style.WARNING(f"{len(quantities) - matched} slugs did not match a product"))
+        self.stdout.write(self.style.SUCCESS(f"Restocked {matched} products"))
@@ -0,0 +1,69 @@
+import statistics
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from django.core.management.base import BaseCommand
+
+from honey_api.search import search_fields
+from honey_api.serializer import PRODUCT_CARD_PROJECTION, mongo_serializer, product_document_serializer
+
+
+def make_product(index, category_id):
+    title = f"Benchmark Honey {index}"
+    product = {
+        '_id': ObjectId(),
+        'title': title,
+        'slug': f"benchmark-honey-{index}",
+        'category_id': category_id,
+        'price': 10.0 + index % 40,
+        'description': 'Raw, unfiltered honey from wildflower meadows. ' * 6,
+        'images': [f"products/{index}-{n}.jpg" for n in range(4)],
+        'status': 'active',
+        'modified_at': datetime.now(),
+        'rating': 4.5,
+        'review_count': 12,
+        'rating_sum': 54,
+        'rating_histogram': {'1': 0, '2': 1, '3': 0, '4': 3, '5': 8},
+    }
+    product.update(search_fields(title, 'Raw Honey'))
+    return product
+
+
+def project(document, projection):
+    return {key: value for key, value in document.items() if key == '_id' or key in projection}
+
+
+class Command(BaseCommand):
+    help = 'Compare mongo_serializer with the fixed-shape product serializer on a large result set'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=10000)
+        parser.add_argument('--runs', type=int, default=5)
+
+    def handle(self, *args, **options):
+        category_id = ObjectId()
+        documents = [make_product(index, category_id) for index in range(options['documents'])]
+        # What the listing queries now get back from the server.
+        cards = [project(document, PRODUCT_CARD_PROJECTION) for document in documents]
+
+        cases = [
+            ('mongo_serializer, full documents', mongo_serializer, documents),
+            ('mongo_serializer, card projection', mongo_serializer, cards),
+            ('product serializer, full documents', product_document_serializer.many, documents),
+            ('product serializer, card projection', product_document_serializer.many, cards),
+        ]
+
+        baseline = None
+        for label, serializer, batch in cases:
+            timings = []
+            for _ in range(options['runs']):
+                started = time.perf_counter()
+                serializer(batch)
+                timings.append((time.perf_counter() - started) * 1000)
+
+            median = statistics.median(timings)
+            baseline = baseline or median
+            self.stdout.write(
+                f"{label:<38} median {median:8.1f}ms  min {min(timings):8.1f}ms  {baseline / median:5.1f}x"
+            )
@@ -0,0 +1,93 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter so nothing is already imported or cached.
+PROBE = """
+import json, os, time
+started = time.perf_counter()
+os.environ['DJANGO_SETTINGS_MODULE'] = {settings_module!r}
+import django
+django.setup()
+from importlib import import_module
+from django.conf import settings
+import_module(settings.ROOT_URLCONF)
+imported = time.perf_counter()
+from django.test import Client
+response = Client().get({path!r}, HTTP_HOST='localhost')
+responded = time.perf_counter()
+from mongodb_connector import mongodb
+print(json.dumps({{
+    'import_ms': (imported - started) * 1000,
+    'first_response_ms': (responded - imported) * 1000,
+    'status': response.status_code,
+    'mongo_connected': mongodb._client is not None,
+}}))
+"""
+
+
+class Command(BaseCommand):
+    help = 'Measure cold start: settings and URLconf import time, then time to first response'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument(
+            '--path', default='/shop/',
+            help='URL requested for the first response; the default reads the catalog, so it includes connecting to MongoDB',
+        )
+        parser.add_argument('--import-budget-ms', type=float, default=1500)
+        parser.add_argument('--response-budget-ms', type=float, default=1000)
+        parser.add_argument('--json', dest='json_path', help='Write the results to this file')
+
+    def handle(self, *args, **options):
+        probe = PROBE.format(settings_module=os.environ['DJANGO_SETTINGS_MODULE'], path=options['path'])
+        runs = []
+
+        for _ in range(options['runs']):
+            result = subprocess.run(
+                [sys.executable, '-c', probe],
+                cwd=settings.BASE_DIR, capture_output=True, text=True,
+            )
+            if result.returncode:
+                raise CommandError(result.stderr.strip().splitlines()[-1])
+            run = json.loads(result.stdout.strip().splitlines()[-1])
+            if run['status'] >= 500:
+                raise CommandError(f"{options['path']} answered {run['status']}")
+            runs.append(run)
+
+        report = {'path': options['path'], 'runs': len(runs)}
+        for metric in ('import_ms', 'first_response_ms'):
+            values = [run[metric] for run in runs]
+            report[metric] = {
+                'min': min(values),
+                'median': statistics.median(values),
+                'max': max(values),
+            }
+        report['mongo_connected'] = any(run['mongo_connected'] for run in runs)
+
+        self.stdout.write(
+            f"import {report['import_ms']['median']:.0f}ms (max {report['import_ms']['max']:.0f}ms), "
+            f"first response {report['first_response_ms']['median']:.0f}ms "
+            f"(max {report['first_response_ms']['max']:.0f}ms) over {len(runs)} runs"
+        )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+        over_budget = []
+        if report['import_ms']['median'] > options['import_budget_ms']:
+            over_budget.append(f"import {report['import_ms']['median']:.0f}ms > {options['import_budget_ms']:.0f}ms")
+        if report['first_response_ms']['median'] > options['response_budget_ms']:
+            over_budget.append(
+                f"first response {report['first_response_ms']['median']:.0f}ms > {options['response_budget_ms']:.0f}ms"
+            )
+
+        if over_budget:
+            raise CommandError('Startup over budget: ' + ', '.join(over_budget))
+        self.stdout.write(self.style.SUCCESS('Startup within budget'))
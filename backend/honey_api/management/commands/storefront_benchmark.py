@@ -0,0 +1,310 @@
+import json
+import platform
+import random
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.urls import reverse
+
+from mongodb_connector import mongodb
+from core.models import Address, User
+from honey_api.mongo_models import CategoryManager, RATING_VALUES, carts
+from honey_api.search import search_fields
+
+SCENARIOS = ('shop', 'product_detail', 'add_to_cart', 'cart_view', 'checkout', 'create_order', 'profile')
+CATEGORY_NAMES = ('Raw Honey', 'Flavored Honey', 'Organic Honey', 'Honey Comb', 'Creamed Honey', 'Gift Sets')
+TITLE_WORDS = (
+    ('Wildflower', 'Clover', 'Manuka', 'Acacia', 'Lavender', 'Buckwheat', 'Orange Blossom', 'Forest'),
+    ('Raw', 'Creamed', 'Organic', 'Spiced', 'Whipped', 'Infused'),
+    ('Honey', 'Comb', 'Spread', 'Nectar'),
+)
+SORTS = ('title', '-title', 'price', '-price', '-rating')
+CART_ITEMS = 3
+INSERT_BATCH = 10000
+
+
+class Command(BaseCommand):
+    help = 'Load-test the storefront views in process against a synthetic catalog and report latency percentiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--reviews', type=int, default=10000)
+        parser.add_argument('--users', type=int, default=20, help='Logged-in shoppers issuing the requests')
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=20, help='Untimed requests per scenario')
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Worker threads sending requests at once, each with its own shoppers and clients',
+        )
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='Repeat to run several; default all')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--database', help='MongoDB database to fill, defaults to <db>_benchmark')
+        parser.add_argument('--keep-data', action='store_true', help='Leave the benchmark database in place')
+        parser.add_argument('--json', dest='json_path', help='Write the results to this file')
+        parser.add_argument('--baseline', help='Results file of an earlier run to compare against')
+        parser.add_argument('--max-regression', type=float, default=20.0, help='Allowed p95 slowdown in percent')
+
+    def handle(self, *args, **options):
+        database = options['database'] or f"{settings.MONGODB_SETTINGS['db']}_benchmark"
+        if database == settings.MONGODB_SETTINGS['db']:
+            raise CommandError('Refusing to fill the application database, pick another --database')
+        if options['concurrency'] < 1 or options['users'] < options['concurrency']:
+            raise CommandError('--concurrency must be at least 1 and at most --users')
+
+        self.random = random.Random(options['seed'])
+        self.options = options
+
+        # Users, sessions and addresses go to a throwaway SQLite test database.
+        original_mongo_settings = settings.MONGODB_SETTINGS
+        original_db_name = connection.settings_dict['NAME']
+        settings.MONGODB_SETTINGS = dict(original_mongo_settings, db=database)
+        mongodb.close()
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+        try:
+            mongodb.database.client.drop_database(database)
+            self.generate()
+            results = {name: self.run_scenario(name) for name in options['scenario'] or SCENARIOS}
+        finally:
+            connection.creation.destroy_test_db(original_db_name, verbosity=0)
+            if not options['keep_data']:
+                mongodb.database.client.drop_database(database)
+            mongodb.close()
+            settings.MONGODB_SETTINGS = original_mongo_settings
+
+        report = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'config': {
+                key: options[key]
+                for key in ('products', 'reviews', 'users', 'requests', 'warmup', 'seed', 'concurrency')
+            },
+            'scenarios': results,
+        }
+        self.print_report(results)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+        failures = [f"{name}: {result['errors']} failed requests" for name, result in results.items() if result['errors']]
+        if options['baseline']:
+            failures += self.compare(report, options['baseline'], options['max_regression'])
+        if failures:
+            raise CommandError('Benchmark failed: ' + '; '.join(failures))
+        self.stdout.write(self.style.SUCCESS('Benchmark passed'))
+
+    def generate(self):
+        options = self.options
+        started = time.perf_counter()
+
+        category_manager = CategoryManager()
+        self.categories = [category_manager.create_category(name) for name in CATEGORY_NAMES]
+
+        # Review i goes to product i % products from author i // products, so
+        # (user_id, product_slug) stays unique and authors need no SQLite row.
+        histograms = [[0] * len(RATING_VALUES) for _ in range(options['products'])]
+        batch = []
+        for index in range(options['reviews']):
+            product_index = index % options['products']
+            rating = self.random.choice(RATING_VALUES)
+            histograms[product_index][rating - 1] += 1
+            batch.append({
+                'user_id': 100000 + index // options['products'],
+                'product_slug': f"benchmark-product-{product_index}",
+                'rating': rating,
+                'comment': 'Synthetic review',
+                'date': datetime.now(),
+            })
+            if len(batch) >= INSERT_BATCH:
+                mongodb.database['reviews'].insert_many(batch, ordered=False)
+                batch = []
+        if batch:
+            mongodb.database['reviews'].insert_many(batch, ordered=False)
+
+        batch = []
+        self.products = []
+        for index in range(options['products']):
+            category = self.random.choice(self.categories)
+            title = ' '.join(self.random.choice(words) for words in TITLE_WORDS) + f" {index}"
+            histogram = histograms[index]
+            review_count = sum(histogram)
+            rating_sum = sum(count * value for count, value in zip(histogram, RATING_VALUES))
+            product = {
+                'title': title,
+                'slug': f"benchmark-product-{index}",
+                'category_id': category['_id'],
+                'price': round(self.random.uniform(5, 60), 2),
+                'description': 'Synthetic benchmark product. ' * 8,
+                'images': [],
+                'status': 'active',
+                'modified_at': datetime.now(),
+                'rating': round(rating_sum / review_count, 1) if review_count else 0,
+                'review_count': review_count,
+                'rating_sum': rating_sum,
+                'rating_histogram': {str(value): count for value, count in zip(RATING_VALUES, histogram)},
+            }
+            product.update(search_fields(title, category['name']))
+            batch.append(product)
+            self.products.append((product['slug'], product['price']))
+            if len(batch) >= INSERT_BATCH:
+                mongodb.database['products'].insert_many(batch, ordered=False)
+                batch = []
+        if batch:
+            mongodb.database['products'].insert_many(batch, ordered=False)
+
+        call_command('ensure_indexes', verbosity=0)
+
+        self.shoppers = []
+        for index in range(options['users']):
+            user = User(username=f"benchmark-{index}")
+            user.set_unusable_password()
+            user.save()
+            address = Address.objects.create(
+                user=user, name='Home', address='1 Hive Lane', city='Springfield',
+                state='State', postal_code='12345', is_default=True,
+            )
+            client = Client(HTTP_HOST='localhost')
+            client.force_login(user)
+            self.shoppers.append((client, user, address))
+            self.fill_cart(self.random, user)
+
+        self.stdout.write(
+            f"Generated {options['products']} products and {options['reviews']} reviews "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+
+    def fill_cart(self, rng, user):
+        for slug, price in rng.sample(self.products, min(CART_ITEMS, len(self.products))):
+            carts.add_item(user.id, slug, 1, price)
+
+    def request_for(self, name, rng, client, user, address):
+        """Returns the timed request for one iteration; anything it needs is set up untimed."""
+        if name == 'shop':
+            pages = max(len(self.products) // 4, 1)
+            query = {'page': rng.randint(1, min(pages, 50)), 'sort': rng.choice(SORTS)}
+            if rng.random() < 0.5:
+                query['category'] = rng.choice(self.categories)['slug']
+            return lambda: client.get(reverse('shop'), query)
+
+        if name == 'product_detail':
+            slug = rng.choice(self.products)[0]
+            return lambda: client.get(reverse('product_detail', args=[slug]))
+
+        if name == 'add_to_cart':
+            slug = rng.choice(self.products)[0]
+            return lambda: client.post(reverse('add_to_cart'), {'product_slug': slug, 'quantity': 1})
+
+        if name == 'cart_view':
+            return lambda: client.get(reverse('cart'))
+
+        if name == 'checkout':
+            return lambda: client.get(reverse('checkout'))
+
+        if name == 'create_order':
+            cart = carts.get_or_create(user.id)
+            if not cart['items']:
+                self.fill_cart(rng, user)
+                cart = carts.get_or_create(user.id)
+            data = {'cart_id': str(cart['_id']), 'idempotency_key': uuid.uuid4().hex, 'saved_address': address.id}
+            return lambda: client.post(reverse('create_order'), data)
+
+        if name == 'profile':
+            return lambda: client.get(reverse('profile'))
+
+    def run_scenario(self, name):
+        concurrency = self.options['concurrency']
+        # Every worker drives its own shoppers, so no test Client is shared between threads.
+        workers = [
+            (self.shoppers[index::concurrency], random.Random(self.random.random())) for index in range(concurrency)
+        ]
+
+        def share(total, index):
+            return total // concurrency + (index < total % concurrency)
+
+        def drive(index, iterations, timed):
+            shoppers, rng = workers[index]
+            latencies = []
+            errors = 0
+            try:
+                for _ in range(iterations):
+                    client, user, address = rng.choice(shoppers)
+                    request = self.request_for(name, rng, client, user, address)
+
+                    started = time.perf_counter()
+                    response = request()
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+
+                    if timed:
+                        latencies.append(elapsed_ms)
+                        if response.status_code >= 400 or 'login' in response.get('Location', ''):
+                            errors += 1
+
+                    if name == 'create_order':
+                        self.fill_cart(rng, user)
+            finally:
+                connections.close_all()
+            return latencies, errors
+
+        def run_all(total, timed):
+            return list(pool.map(lambda index: drive(index, share(total, index), timed), range(concurrency)))
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            run_all(self.options['warmup'], False)
+            # Throughput is over wall-clock time, so it shows what the workers achieve together
+            # (the untimed setup between requests, e.g. refilling carts, is included).
+            started = time.perf_counter()
+            runs = run_all(self.options['requests'], True)
+            elapsed = time.perf_counter() - started
+
+        latencies = [latency for run_latencies, _ in runs for latency in run_latencies]
+        percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+        return {
+            'requests': len(latencies),
+            'concurrency': concurrency,
+            'errors': sum(run_errors for _, run_errors in runs),
+            'mean_ms': statistics.fmean(latencies),
+            'p50_ms': percentiles[49],
+            'p95_ms': percentiles[94],
+            'p99_ms': percentiles[98],
+            'throughput_rps': len(latencies) / elapsed,
+        }
+
+    def print_report(self, results):
+        self.stdout.write(f"{self.options['concurrency']} concurrent worker(s)")
+        self.stdout.write(f"{'scenario':<16}{'p50':>10}{'p95':>10}{'p99':>10}{'req/s':>10}{'errors':>8}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<16}{result['p50_ms']:>8.1f}ms{result['p95_ms']:>8.1f}ms{result['p99_ms']:>8.1f}ms"
+                f"{result['throughput_rps']:>10.1f}{result['errors']:>8}"
+            )
+
+    def compare(self, report, baseline_path, max_regression):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+
+        # Latency under one load says nothing about latency under another.
+        config = dict(baseline.get('config', {}))
+        baseline_concurrency = config.pop('concurrency', 1)
+        if baseline_concurrency != report['config']['concurrency']:
+            raise CommandError(f"Baseline was recorded at --concurrency {baseline_concurrency}, rerun with it to compare")
+        if config != {key: value for key, value in report['config'].items() if key != 'concurrency'}:
+            self.stderr.write('Baseline was recorded with a different configuration, comparing anyway')
+
+        regressions = []
+        for name, result in report['scenarios'].items():
+            previous = baseline.get('scenarios', {}).get(name)
+            if previous is None:
+                continue
+            limit = previous['p95_ms'] * (1 + max_regression / 100)
+            if result['p95_ms'] > limit:
+                regressions.append(f"{name} p95 {result['p95_ms']:.1f}ms > {limit:.1f}ms")
+        return regressions
@@ -0,0 +1,250 @@
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from honey_api.catalog_cache import request_versions
+from mongodb_monitoring import active_recorder
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'server_timing': False,
+    # The same call repeated this often in one request is reported as a likely N+1.
+    'repeat_threshold': 10,
+}
+
+SQL_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN)\s+["`]?(\w+)', re.IGNORECASE)
+
+
+def query_accounting_settings():
+    return dict(DEFAULT_SETTINGS, **getattr(settings, 'QUERY_ACCOUNTING', {}))
+
+
+class QueryRecorder:
+    """Counts and times the database calls of one request, per backend, target and operation."""
+
+    def __init__(self, parent=None):
+        # Calls are also passed to the enclosing recorder, e.g. a test's query budget.
+        self.parent = parent
+        self.calls = defaultdict(lambda: {'count': 0, 'ms': 0.0, 'failed': 0})
+        self._lock = threading.Lock()
+
+    def add(self, backend, target, operation, duration_ms, failed=False):
+        with self._lock:
+            call = self.calls[(backend, target, operation)]
+            call['count'] += 1
+            call['ms'] += duration_ms
+            call['failed'] += int(failed)
+        if self.parent is not None:
+            self.parent.add(backend, target, operation, duration_ms, failed)
+
+    def count(self, backend):
+        return sum(call['count'] for (name, _, _), call in self.calls.items() if name == backend)
+
+    def duration_ms(self, backend):
+        return sum(call['ms'] for (name, _, _), call in self.calls.items() if name == backend)
+
+    def repeated(self, threshold):
+        return {key: call['count'] for key, call in self.calls.items() if call['count'] >= threshold}
+
+    def summary(self):
+        return ', '.join(
+            f"{backend} {target}.{operation} x{call['count']}"
+            for (backend, target, operation), call in sorted(self.calls.items())
+        )
+
+    def server_timing(self, total_ms):
+        entries = [f'total;dur={total_ms:.1f}']
+        for backend in ('mongo', 'sql'):
+            entries.append(f'{backend};dur={self.duration_ms(backend):.1f};desc="{self.count(backend)} calls"')
+        for (backend, target, operation), call in sorted(self.calls.items()):
+            entries.append(f'{backend}.{target}.{operation};dur={call["ms"]:.1f};desc="{call["count"]}"')
+        return ', '.join(entries)
+
+
+def record_sql(execute, sql, params, many, context):
+    recorder = active_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    failed = False
+    try:
+        return execute(sql, params, many, context)
+    except Exception:
+        failed = True
+        raise
+    finally:
+        table = SQL_TABLE.search(sql)
+        operation = sql.split(None, 1)[0].upper() if sql.strip() else 'EMPTY'
+        recorder.add(
+            'sql', table.group(1) if table else '-', operation, (time.perf_counter() - started) * 1000, failed,
+        )
+
+
+def install_sql_recorder(connection, **kwargs):
+    # Installed on every connection, not per request, because async views run
+    # their ORM calls on another thread with its own connection.
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_sql)
+
+
+connection_created.connect(install_sql_recorder)
+
+
+class QueryStats:
+    """Process-wide totals per view, served by the query metrics endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = defaultdict(self._empty)
+        self._calls = defaultdict(lambda: {'count': 0, 'ms': 0.0, 'failed': 0})
+
+    @staticmethod
+    def _empty():
+        return {
+            'requests': 0,
+            'total_ms': 0.0,
+            'mongo_calls': 0,
+            'mongo_ms': 0.0,
+            'sql_calls': 0,
+            'sql_ms': 0.0,
+            'max_calls': 0,
+            'repeated_call_requests': 0,
+        }
+
+    def record(self, view_name, recorder, total_ms, repeated):
+        with self._lock:
+            stats = self._views[view_name]
+            stats['requests'] += 1
+            stats['total_ms'] += total_ms
+            for backend in ('mongo', 'sql'):
+                stats[f'{backend}_calls'] += recorder.count(backend)
+                stats[f'{backend}_ms'] += recorder.duration_ms(backend)
+            stats['max_calls'] = max(stats['max_calls'], recorder.count('mongo') + recorder.count('sql'))
+            stats['repeated_call_requests'] += int(bool(repeated))
+
+            for (backend, target, operation), call in recorder.calls.items():
+                totals = self._calls[f'{backend}.{target}.{operation}']
+                for key in ('count', 'ms', 'failed'):
+                    totals[key] += call[key]
+
+    def snapshot(self):
+        with self._lock:
+            views = {}
+            for view_name, stats in self._views.items():
+                stats = dict(stats)
+                for key in ('total_ms', 'mongo_calls', 'mongo_ms', 'sql_calls', 'sql_ms'):
+                    stats[f'avg_{key}'] = stats[key] / stats['requests']
+                views[view_name] = stats
+            return {'views': views, 'calls': {key: dict(call) for key, call in self._calls.items()}}
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+            self._calls.clear()
+
+
+query_stats = QueryStats()
+
+
+class QueryAccountingMiddleware:
+    """
+    Counts and times the MongoDB commands and SQL queries of every request,
+    adds them to the process-wide query_stats and, when enabled, reports
+    them to the client in a Server-Timing header.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+        for connection in connections.all(initialized_only=True):
+            install_sql_recorder(connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        recorder = QueryRecorder(parent=active_recorder.get())
+        token = active_recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            active_recorder.reset(token)
+        return self.finish(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder(parent=active_recorder.get())
+        token = active_recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            active_recorder.reset(token)
+        return self.finish(request, response, recorder, started)
+
+    def finish(self, request, response, recorder, started):
+        options = query_accounting_settings()
+        total_ms = (time.perf_counter() - started) * 1000
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else 'unresolved'
+
+        repeated = recorder.repeated(options['repeat_threshold'])
+        if repeated:
+            logger.warning(
+                "Possible N+1 in %s: %s", view_name,
+                ', '.join(f"{backend} {target}.{operation} x{count}" for (backend, target, operation), count in repeated.items()),
+            )
+
+        query_stats.record(view_name, recorder, total_ms, repeated)
+
+        if options['server_timing']:
+            response['Server-Timing'] = recorder.server_timing(total_ms)
+        return response
+
+
+class CatalogVersionMiddleware:
+    """
+    Reads the catalog versions at most once per request, so a page built
+    from several cached lookups sees one consistent catalog.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        token = request_versions.set({})
+        try:
+            return self.get_response(request)
+        finally:
+            request_versions.reset(token)
+
+    async def __acall__(self, request):
+        token = request_versions.set({})
+        try:
+            return await self.get_response(request)
+        finally:
+            request_versions.reset(token)
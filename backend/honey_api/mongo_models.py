@@ -1,38 +1,161 @@
 from mongodb_connector import mongodb
-from datetime import datetime
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
-from honey_api.utils import get_object_id, generate_unique_slug, generate_order_number
+from honey_api.utils import (
+    SHIPPING_AMOUNT, TAX_AMOUNT, allocate_slugs, get_object_id, generate_unique_slug, generate_order_number,
+)
+from honey_api.search import TEXT_WEIGHTS, search_fields
+from honey_api.catalog_cache import catalog_cache, product_namespace
+from honey_api.loaders import ProductLoader
+from honey_api.archive import ORDER_ARCHIVE_INDEXES, order_archive_name, order_archives, retention_settings
+from honey_api.inventory import inventory_settings, release_reservations, reservation_expired, reservation_is
+from honey_api.pagination import KeysetPage
+from honey_api.recommendations import RECOMMENDATIONS_COLLECTION, top_neighbours
+
+RATING_VALUES = range(1, 6)
+
+# Seconds to wait, in turn, for a same-key submit that claimed the cart to insert its order.
+PLACED_ORDER_RETRY_DELAYS = (0.05, 0.1, 0.2)
+
+
+def empty_rating_fields():
+    return {
+        'rating': 0,
+        'review_count': 0,
+        'rating_sum': 0,
+        'rating_histogram': {str(value): 0 for value in RATING_VALUES},
+    }
 
 class BaseMongoModel:
+    indexes = []
+
     def __init__(self, collection_name):
         self.collection_name = collection_name
-        self.collection = mongodb.database[collection_name]
+
+    @property
+    def collection(self):
+        # Resolved on every access so a forked worker never reuses its parent's client.
+        return mongodb.database[self.collection_name]
     
     def create(self, data):
         self.collection.insert_one(data)
 
+    def create_with_unique_slug(self, data, title, attempts=5):
+        # The counter hands out fresh slugs; the unique index settles any race with legacy rows.
+        for _ in range(attempts):
+            data['slug'] = generate_unique_slug(self.collection_name, title)
+            try:
+                self.create(data)
+                return data
+            except DuplicateKeyError as e:
+                if 'slug' not in (e.details or {}).get('keyPattern', {}):
+                    raise
+                data.pop('_id', None)
+
+        raise DuplicateKeyError(f"Could not allocate a unique slug for {title!r}")
+
+    def create_many_with_unique_slugs(self, documents, titles):
+        # One counter update per distinct title, then one insert for the whole batch.
+        for data, slug in zip(documents, allocate_slugs(self.collection_name, titles)):
+            data['slug'] = slug
+        try:
+            self.collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details['writeErrors']
+            if any('slug' not in error.get('keyPattern', {}) for error in errors):
+                raise
+            # Slugs held by rows from before the counter existed: retry those one by one.
+            for error in errors:
+                data = documents[error['index']]
+                data.pop('_id', None)
+                self.create_with_unique_slug(data, titles[error['index']])
+        return documents
+
 class CategoryManager(BaseMongoModel):
+    indexes = [
+        IndexModel([('slug', ASCENDING)], name='slug_unique', unique=True),
+    ]
+
     def __init__(self):
         super().__init__('categories')
     
     def create_category(self, name, description="", parent_id=None):
         data = {
             'name': name,
-            'slug': generate_unique_slug(self.collection_name, name),
             'description': description,
             'parent_id': get_object_id(parent_id) if parent_id else None
         }
-        self.create(data)
+        self.create_with_unique_slug(data, name)
+        catalog_cache.bump('categories')
+        return data
+
+    def update_category(self, category_id, **changes):
+        category_id = get_object_id(category_id)
+        self.collection.update_one({'_id': category_id}, {'$set': changes})
+
+        if 'name' in changes:
+            mongodb.database['products'].update_many(
+                {'category_id': category_id},
+                {'$set': {'category_name': changes['name'], 'modified_at': datetime.now()}}
+            )
+            catalog_cache.bump('products')
+
+        catalog_cache.bump('categories')
     
     
 class ProductManager(BaseMongoModel):
+    indexes = [
+        IndexModel([('slug', ASCENDING)], name='slug_unique', unique=True),
+        # Feed ids from import_catalog; products created in the shop have none.
+        IndexModel(
+            [('sku', ASCENDING)], name='sku_unique', unique=True,
+            partialFilterExpression={'sku': {'$type': 'string'}},
+        ),
+        IndexModel([('title', ASCENDING), ('_id', ASCENDING)], name='title'),
+        IndexModel([('price', ASCENDING), ('_id', ASCENDING)], name='price'),
+        IndexModel([('category_id', ASCENDING), ('title', ASCENDING), ('_id', ASCENDING)], name='category_title'),
+        IndexModel([('category_id', ASCENDING), ('price', ASCENDING), ('_id', ASCENDING)], name='category_price'),
+        IndexModel([('rating', DESCENDING), ('_id', DESCENDING)], name='rating'),
+        IndexModel([('category_id', ASCENDING), ('rating', DESCENDING), ('_id', DESCENDING)], name='category_rating'),
+        IndexModel([('search_prefixes', ASCENDING)], name='search_prefixes'),
+        IndexModel([('modified_at', ASCENDING), ('_id', ASCENDING)], name='modified_at'),
+        IndexModel(
+            [('title', TEXT), ('category_name', TEXT), ('description', TEXT)],
+            name='search_text', weights=TEXT_WEIGHTS, default_language='english',
+        ),
+    ]
+
     def __init__(self):
         super().__init__('products')
     
-    def create_product(self, title, category_id, price, description):
+    def create_product(self, title, category_id, price, description, stock=None):
+        data = self._new_product(title, category_id, price, description, stock)
+        data.update(search_fields(title, self._category_name(data['category_id'])))
+        self.create_with_unique_slug(data, title)
+        catalog_cache.bump('products')
+
+    def create_products(self, products):
+        """Creates many products, given as dicts of create_product's arguments, in one insert."""
+        documents = [self._new_product(**product) for product in products]
+        category_ids = list({data['category_id'] for data in documents})
+        names = {
+            category['_id']: category['name']
+            for category in mongodb.database['categories'].find({'_id': {'$in': category_ids}}, {'name': 1})
+        }
+        for data in documents:
+            data.update(search_fields(data['title'], names.get(data['category_id'], '')))
+
+        self.create_many_with_unique_slugs(documents, [data['title'] for data in documents])
+        catalog_cache.bump('products')
+        return documents
+
+    def _new_product(self, title, category_id, price, description, stock=None):
         data = {
             'title': title,
-            'slug': generate_unique_slug(self.collection_name, title),
             'category_id': get_object_id(category_id),
             'price': float(price),
             'description': description,
@@ -40,10 +163,126 @@ class ProductManager(BaseMongoModel):
             'status': 'active',
             'modified_at': datetime.now()
         }
-        self.create(data)
+        data.update(empty_rating_fields())
+        # Products without a stock level are never sold out.
+        if stock is not None:
+            data['stock'] = int(stock)
+        return data
+
+    def update_product(self, slug, **changes):
+        if 'category_id' in changes:
+            changes['category_id'] = get_object_id(changes['category_id'])
+        if 'price' in changes:
+            changes['price'] = float(changes['price'])
+
+        if 'title' in changes or 'category_id' in changes:
+            product = self.collection.find_one({'slug': slug}, {'title': 1, 'category_id': 1})
+            title = changes.get('title', product['title'])
+            category_id = changes.get('category_id', product['category_id'])
+            changes.update(search_fields(title, self._category_name(category_id)))
+
+        changes['modified_at'] = datetime.now()
+        self.collection.update_one({'slug': slug}, {'$set': changes})
+        catalog_cache.bump('products')
+
+    def add_rating(self, slug, rating):
+        self.collection.update_one({'slug': slug}, {'$inc': {
+            'review_count': 1,
+            'rating_sum': rating,
+            f'rating_histogram.{rating}': 1,
+        }})
+        # Derived from the stored counters, so concurrent reviews converge on the right average.
+        self.collection.update_one({'slug': slug, 'review_count': {'$gt': 0}}, [{'$set': {
+            'rating': {'$round': [{'$divide': ['$rating_sum', '$review_count']}, 1]},
+            'modified_at': datetime.now(),
+        }}])
+        # Only this product's own entries; listings pick the rating up when their cache expires.
+        catalog_cache.bump(product_namespace(slug))
+
+    # Stock is only ever taken by a write guarded on `stock >= quantity`, so
+    # concurrent checkouts on one product cannot oversell it and never wait
+    # on anything but MongoDB's own document-level concurrency.
+    def reserve_stock(self, slug, quantity, reservation_id, expires_at):
+        """Holds `quantity` for the reservation until `expires_at`, replacing its earlier hold."""
+        # One write hands back the earlier hold and every lapsed one, so the
+        # array stays small on busy products, then takes the stock if it suffices.
+        reservation = {'id': reservation_id, 'quantity': quantity, 'expires_at': expires_at}
+        enough = {'$gte': ['$stock', quantity]}
+        product = self.collection.find_one_and_update(
+            {'slug': slug, 'stock': {'$type': 'number'}},
+            [
+                release_reservations({'$or': [reservation_is(reservation_id), reservation_expired(datetime.now())]}),
+                {'$set': {
+                    'stock': {'$cond': [enough, {'$subtract': ['$stock', quantity]}, '$stock']},
+                    'reservations': {'$cond': [
+                        enough, {'$concatArrays': ['$reservations', [{'$literal': reservation}]]}, '$reservations',
+                    ]},
+                }},
+            ],
+            projection={'reservations': {'$elemMatch': {'id': reservation_id}}},
+            return_document=ReturnDocument.AFTER,
+        )
+        return bool(product and product.get('reservations'))
+
+    def commit_stock(self, slug, quantity, reservation_id):
+        """Sells the held stock, or takes it afresh when the hold lapsed or no longer matches."""
+        result = self.collection.update_one(
+            {'slug': slug, 'reservations': {'$elemMatch': {'id': reservation_id, 'quantity': quantity}}},
+            {'$pull': {'reservations': {'id': reservation_id}}},
+        )
+        if result.modified_count:
+            return True
+        self.release_stock(slug, reservation_id)
+        return self._take_stock(slug, quantity)
+
+    def release_stock(self, slug, reservation_id):
+        self.collection.update_one(
+            {'slug': slug, 'reservations.id': reservation_id},
+            [release_reservations(reservation_is(reservation_id))],
+        )
+
+    def return_stock(self, slug, quantity):
+        self.collection.update_one({'slug': slug, 'stock': {'$type': 'number'}}, {'$inc': {'stock': quantity}})
+
+    def release_expired(self):
+        now = datetime.now()
+        return self.collection.update_many(
+            {'reservations.expires_at': {'$lte': now}}, [release_reservations(reservation_expired(now))],
+        ).modified_count
+
+    def restock(self, quantities, replace=False):
+        """Adds to (or with `replace`, sets) the stock of many products in one bulk write."""
+        operator = '$set' if replace else '$inc'
+        operations = [UpdateOne({'slug': slug}, {operator: {'stock': int(quantity)}}) for slug, quantity in quantities.items()]
+        if not operations:
+            return 0
+        return self.collection.bulk_write(operations, ordered=False).matched_count
+
+    def _take_stock(self, slug, quantity, update=None):
+        update = dict(update or {}, **{'$inc': {'stock': -quantity}})
+        guard = {'slug': slug, 'stock': {'$gte': quantity}}
+        if self.collection.update_one(guard, update).modified_count:
+            return True
+
+        # Short on stock: lapsed reservations may still be holding some of it.
+        now = datetime.now()
+        released = self.collection.update_one(
+            {'slug': slug, 'reservations.expires_at': {'$lte': now}},
+            [release_reservations(reservation_expired(now))],
+        )
+        return bool(released.modified_count) and bool(self.collection.update_one(guard, update).modified_count)
+
+    def _category_name(self, category_id):
+        category = mongodb.database['categories'].find_one({'_id': category_id}, {'name': 1})
+        return category['name'] if category else ''
     
 
 class ReviewManager(BaseMongoModel):
+    indexes = [
+        IndexModel([('product_slug', ASCENDING), ('date', DESCENDING), ('_id', DESCENDING)], name='product_date'),
+        IndexModel([('user_id', ASCENDING), ('product_slug', ASCENDING)], name='user_product_unique', unique=True),
+    ]
+
     def __init__(self):
         super().__init__('reviews')
     
@@ -55,42 +294,514 @@ class ReviewManager(BaseMongoModel):
             'comment': comment,
             'date': datetime.now()
         }
+        if data['rating'] not in RATING_VALUES:
+            raise ValueError("Rating must be between 1 and 5.")
+
         self.create(data)
+        ProductManager().add_rating(product_slug, data['rating'])
+        UserStatsManager().record_review(data['user_id'])
     
 
 class CartManager(BaseMongoModel):
+    indexes = [
+        IndexModel([('user_id', ASCENDING)], name='user_unique', unique=True),
+        # Abandoned carts are removed by the server once they go untouched this long.
+        IndexModel(
+            [('last_touched', ASCENDING)], name='last_touched_ttl',
+            expireAfterSeconds=retention_settings()['cart_ttl_days'] * 24 * 60 * 60,
+        ),
+    ]
+
     def __init__(self):
         super().__init__('carts')
     
-    def create_cart(self, user_id):
-        cart_data = {
-            'user_id': int(user_id),
-            'items': [],
-            'total_amount': 0.0
-        }
-        self.create(cart_data)
+    def get_or_empty(self, user_id):
+        # Reading a cart never creates one; it is stored once something is added.
+        cart = self.collection.find_one({'user_id': int(user_id)})
+        if cart is None:
+            cart = {'_id': None, 'user_id': int(user_id), 'items': [], 'total_amount': 0.0}
+        return cart
+
+    def get_or_create(self, user_id):
+        return self.collection.find_one_and_update(
+            {'user_id': int(user_id)},
+            {'$setOnInsert': {'items': [], 'total_amount': 0.0}, '$set': {'last_touched': datetime.now()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def add_item(self, user_id, product_slug, quantity, price):
+        # One upsert whichever way it goes: a new cart, a new item or more of one already in it.
+        user_id = int(user_id)
+        items = {'$ifNull': ['$items', []]}
+        has_item = {'$in': [{'$literal': product_slug}, {'$ifNull': ['$items.product_slug', []]}]}
+        pipeline = [{'$set': {
+            'items': {'$cond': [
+                has_item,
+                {'$map': {
+                    'input': items,
+                    'as': 'item',
+                    'in': {'$cond': [
+                        {'$eq': ['$$item.product_slug', {'$literal': product_slug}]},
+                        {'$mergeObjects': ['$$item', {'quantity': {'$add': ['$$item.quantity', quantity]}}]},
+                        '$$item',
+                    ]},
+                }},
+                {'$concatArrays': [items, [{'$literal': {
+                    'product_slug': product_slug, 'quantity': quantity, 'price': price,
+                }}]]},
+            ]},
+            'total_amount': {'$add': [{'$ifNull': ['$total_amount', 0.0]}, quantity * price]},
+            'last_touched': datetime.now(),
+        }}]
+
+        for attempt in range(2):
+            try:
+                self.collection.update_one({'user_id': user_id}, pipeline, upsert=True)
+                return
+            except DuplicateKeyError:
+                # Another request created the cart first; the retry updates it instead.
+                if attempt:
+                    raise
+
+    def set_quantity(self, user_id, product_slug, quantity):
+        if quantity <= 0:
+            return self.remove_item(user_id, product_slug)
+
+        self._update_items(user_id, {'$map': {
+            'input': '$items',
+            'as': 'item',
+            'in': {'$cond': [
+                {'$eq': ['$$item.product_slug', product_slug]},
+                {'$mergeObjects': ['$$item', {'quantity': quantity}]},
+                '$$item',
+            ]},
+        }})
+
+    def remove_item(self, user_id, product_slug):
+        self._update_items(user_id, {'$filter': {
+            'input': '$items',
+            'as': 'item',
+            'cond': {'$ne': ['$$item.product_slug', product_slug]},
+        }})
+
+    def clear(self, user_id):
+        return self.collection.find_one_and_update(
+            {'user_id': int(user_id)},
+            {'$set': {'items': [], 'total_amount': 0.0, 'last_touched': datetime.now()}},
+        )
+
+    def reserve(self, cart, products):
+        """Holds the stock of the cart's items for a while; returns the slugs that are short."""
+        expires_at = datetime.now() + timedelta(minutes=inventory_settings()['reservation_minutes'])
+        manager = ProductManager()
+        return [
+            item['product_slug'] for item in cart['items']
+            if stock_tracked(products[item['product_slug']])
+            and not manager.reserve_stock(item['product_slug'], item['quantity'], cart['_id'], expires_at)
+        ]
+
+    def stamp_untouched(self):
+        # Carts from before last_touched existed would never expire otherwise.
+        return self.collection.update_many(
+            {'last_touched': {'$exists': False}}, {'$set': {'last_touched': datetime.now()}},
+        ).modified_count
+
+    def restore(self, cart):
+        # Puts a claimed cart back; items added to a new cart meanwhile are kept.
+        try:
+            self.collection.insert_one(cart)
+        except DuplicateKeyError:
+            self.collection.update_one(
+                {'user_id': cart['user_id']},
+                {
+                    '$push': {'items': {'$each': cart['items']}},
+                    '$inc': {'total_amount': cart['total_amount']},
+                    '$set': {'last_touched': datetime.now()},
+                },
+            )
+
+    def _update_items(self, user_id, items):
+        # A pipeline update rewrites the items and recomputes the total in one atomic write.
+        self.collection.update_one({'user_id': int(user_id)}, [
+            {'$set': {'items': items, 'last_touched': datetime.now()}},
+            {'$set': {'total_amount': {'$sum': {'$map': {
+                'input': '$items',
+                'as': 'item',
+                'in': {'$multiply': ['$$item.quantity', {'$ifNull': ['$$item.price', 0]}]},
+            }}}}},
+        ])
     
 
 class OrderManager(BaseMongoModel):
+    indexes = [
+        IndexModel([('user_id', ASCENDING), ('date', DESCENDING), ('_id', DESCENDING)], name='user_date'),
+        IndexModel([('order_number', ASCENDING)], name='order_number_unique', unique=True),
+        IndexModel([('date', ASCENDING), ('_id', ASCENDING)], name='date'),
+        IndexModel(
+            [('user_id', ASCENDING), ('idempotency_key', ASCENDING)],
+            name='user_idempotency_key_unique', unique=True,
+            partialFilterExpression={'idempotency_key': {'$type': 'string'}},
+        ),
+    ]
+
     def __init__(self):
         super().__init__('orders')
+
+    def history(self, user_id, per_page, cursor=None, stats=None, serializer=list):
+        """
+        A keyset page of the user's orders, newest first. The monthly archives
+        are only read once the page runs past the orders still in `orders`.
+        """
+        user_id = int(user_id)
+
+        def archives():
+            user = stats if stats is not None else UserStatsManager().collection.find_one(
+                {'user_id': user_id}, {'archived_order_date': 1},
+            )
+            archived_until = (user or {}).get('archived_order_date')
+            if archived_until is None:
+                return []
+            return [mongodb.database[name] for name in order_archives(mongodb.database, until=archived_until)]
+
+        return KeysetPage(
+            self.collection, {'user_id': user_id}, 'date', -1, per_page, cursor=cursor,
+            serializer=serializer, fallbacks=archives,
+        )
+
+    def archive_before(self, cutoff, batch_size):
+        """
+        Moves one batch of orders placed before `cutoff` into their monthly
+        archive collections and returns how many were moved.
+
+        Orders are copied before they are deleted, so an interrupted run only
+        leaves copies that the next run skips over.
+        """
+        batch = list(self.collection.find(
+            {'date': {'$lt': cutoff}}, sort=[('date', ASCENDING), ('_id', ASCENDING)],
+        ).limit(batch_size))
+        if not batch:
+            return 0
+
+        by_month = defaultdict(list)
+        for order in batch:
+            by_month[order_archive_name(order['date'])].append(order)
+
+        for name, archived in by_month.items():
+            archive = mongodb.database[name]
+            archive.create_indexes(ORDER_ARCHIVE_INDEXES)
+            try:
+                archive.insert_many(archived, ordered=False)
+            except BulkWriteError as e:
+                if any(error['code'] != 11000 for error in e.details['writeErrors']):
+                    raise
+
+        newest = {}
+        for order in batch:
+            newest[order['user_id']] = max(order['date'], newest.get(order['user_id'], order['date']))
+        UserStatsManager().mark_archived(newest)
+
+        self.collection.delete_many({'_id': {'$in': [order['_id'] for order in batch]}})
+        return len(batch)
+
+    def get_by_idempotency_key(self, user_id, idempotency_key):
+        return self.collection.find_one({'user_id': int(user_id), 'idempotency_key': idempotency_key})
+
+    def place_order(self, user_id, cart_id, address_id, idempotency_key):
+        """
+        Turns the user's cart into an order and returns (order, created).
+
+        Prices and totals are recomputed from the catalog. Retrying with the
+        same idempotency key returns the order it already placed. The cart is
+        claimed by deleting it, so of two concurrent submits only one gets
+        it; without transactions a failed insert puts the cart back.
+
+        Stock is taken outside the transaction, so buyers of a popular product
+        do not conflict with each other's orders, and handed back if the order
+        is not placed.
+        """
+        user_id = int(user_id)
+        existing = self.get_by_idempotency_key(user_id, idempotency_key)
+        if existing is not None:
+            return existing, False
+
+        cart = mongodb.database['carts'].find_one({'_id': cart_id, 'user_id': user_id})
+        if cart is None or not cart['items']:
+            raise ValueError("Your cart is empty.")
+
+        # One batched price lookup, done before any write so a transaction stays short.
+        products = ProductLoader().load_many(item['product_slug'] for item in cart['items'])
+        unavailable = [item['product_slug'] for item in cart['items'] if products[item['product_slug']] is None]
+        if unavailable:
+            raise ValueError(f"Some products are no longer available: {', '.join(unavailable)}")
+
+        taken = self._take_stock(cart, products)
+
+        def place(session=None):
+            claimed = mongodb.database['carts'].find_one_and_delete(
+                {'_id': cart_id, 'user_id': user_id}, session=session,
+            )
+            if claimed is None:
+                raise CartAlreadyCheckedOut()
+            if claimed['items'] != cart['items']:
+                if session is None:
+                    carts.restore(claimed)
+                raise ValueError("Your cart changed during checkout, please review it and try again.")
+
+            items = [snapshot_order_item(item, products[item['product_slug']]) for item in claimed['items']]
+            subtotal = round(sum(item['total_amount'] for item in items), 2)
+            order = {
+                'user_id': user_id,
+                'items': items,
+                'subtotal': subtotal,
+                'shipping': SHIPPING_AMOUNT,
+                'tax': TAX_AMOUNT,
+                'total_amount': round(subtotal + SHIPPING_AMOUNT + TAX_AMOUNT, 2),
+                'payment_status': 'pending',
+                'order_status': 'processing',
+                'address_id': address_id,
+                'order_number': generate_order_number(),
+                'idempotency_key': idempotency_key,
+                'date': datetime.now(),
+            }
+            try:
+                self.collection.insert_one(order, session=session)
+            except Exception:
+                if session is None:
+                    carts.restore(claimed)
+                raise
+            return order
+
+        try:
+            if mongodb.supports_transactions():
+                with mongodb.database.client.start_session() as session:
+                    order = session.with_transaction(place)
+            else:
+                order = place()
+        except (DuplicateKeyError, CartAlreadyCheckedOut) as e:
+            self._return_stock(taken)
+            # A concurrent submit with the same key won; anything else is a real conflict.
+            # If it only claimed the cart so far, its order shows up a moment later.
+            delays = PLACED_ORDER_RETRY_DELAYS if isinstance(e, CartAlreadyCheckedOut) else ()
+            existing = self._find_placed(user_id, idempotency_key, delays)
+            if existing is None:
+                raise ValueError("This cart has already been checked out.")
+            return existing, False
+        except Exception:
+            self._return_stock(taken)
+            raise
+
+        UserStatsManager().record_order(order['user_id'], order['total_amount'], order['date'])
+        return order, True
     
-    def create_order(self, user_id, items, total_amount, address_id):
-        data = {
-            'user_id': int(user_id),
-            'items': items,
-            'total_amount': float(total_amount),
-            'payment_status': 'pending',
-            'order_status': 'processing',
-            'address_id': address_id,
-            'order_number': generate_order_number(),
-            'date': datetime.now()
+    def _find_placed(self, user_id, idempotency_key, delays):
+        existing = self.get_by_idempotency_key(user_id, idempotency_key)
+        for delay in delays:
+            if existing is not None:
+                break
+            time.sleep(delay)
+            existing = self.get_by_idempotency_key(user_id, idempotency_key)
+        return existing
+
+    def _take_stock(self, cart, products):
+        # The checkout page reserved the stock under the cart's id.
+        manager = ProductManager()
+        taken = []
+        for item in cart['items']:
+            product = products[item['product_slug']]
+            if not stock_tracked(product):
+                continue
+            if not manager.commit_stock(product['slug'], item['quantity'], cart['_id']):
+                self._return_stock(taken)
+                raise ValueError(f"Sorry, there is not enough {product['title']} left in stock.")
+            taken.append((product['slug'], item['quantity']))
+        return taken
+
+    def _return_stock(self, taken):
+        manager = ProductManager()
+        for slug, quantity in taken:
+            manager.return_stock(slug, quantity)
+
+
+class UserStatsManager(BaseMongoModel):
+    indexes = [
+        IndexModel([('user_id', ASCENDING)], name='user_unique', unique=True),
+    ]
+
+    def __init__(self):
+        super().__init__('user_stats')
+
+    # Both run after the order or review is saved, so a user without a stats
+    # document yet gets a full rebuild that already counts it.
+    def record_order(self, user_id, total_amount, date):
+        result = self.collection.update_one(
+            {'user_id': int(user_id)},
+            {'$inc': {'order_count': 1, 'total_spend': float(total_amount)}, '$max': {'last_order_date': date}},
+        )
+        if not result.matched_count:
+            self.rebuild(user_id)
+
+    def record_review(self, user_id):
+        result = self.collection.update_one({'user_id': int(user_id)}, {'$inc': {'review_count': 1}})
+        if not result.matched_count:
+            self.rebuild(user_id)
+
+    def mark_archived(self, newest_by_user):
+        # History reads use this to decide whether the archives are worth a look.
+        operations = [
+            UpdateOne({'user_id': int(user_id)}, {'$max': {'archived_order_date': date}})
+            for user_id, date in newest_by_user.items()
+        ]
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+
+    def get_stats(self, user_id):
+        stats = self.collection.find_one({'user_id': int(user_id)})
+        if stats is None:
+            stats = self.rebuild(user_id)
+        return stats
+
+    def rebuild(self, user_id):
+        user_id = int(user_id)
+        archives = [
+            {'$unionWith': {'coll': name, 'pipeline': [
+                {'$match': {'user_id': user_id}},
+                {'$project': {'kind': 'order', 'archived': True, 'total_amount': 1, 'date': 1}},
+            ]}}
+            for name in order_archives(mongodb.database)
+        ]
+        result = next(mongodb.database['orders'].aggregate([
+            {'$match': {'user_id': user_id}},
+            {'$project': {'kind': 'order', 'total_amount': 1, 'date': 1}},
+            *archives,
+            {'$unionWith': {'coll': 'reviews', 'pipeline': [
+                {'$match': {'user_id': user_id}},
+                {'$project': {'kind': 'review'}},
+            ]}},
+            {'$facet': {
+                'orders': [
+                    {'$match': {'kind': 'order'}},
+                    {'$group': {
+                        '_id': None,
+                        'order_count': {'$sum': 1},
+                        'total_spend': {'$sum': '$total_amount'},
+                        'last_order_date': {'$max': '$date'},
+                    }},
+                ],
+                'reviews': [
+                    {'$match': {'kind': 'review'}},
+                    {'$count': 'review_count'},
+                ],
+                'archived': [
+                    {'$match': {'archived': True}},
+                    {'$group': {'_id': None, 'archived_order_date': {'$max': '$date'}}},
+                ],
+            }},
+        ]))
+
+        orders = result['orders'][0] if result['orders'] else {}
+        reviews = result['reviews'][0] if result['reviews'] else {}
+        archived = result['archived'][0] if result['archived'] else {}
+        stats = {
+            'user_id': user_id,
+            'order_count': orders.get('order_count', 0),
+            'total_spend': orders.get('total_spend', 0.0),
+            'last_order_date': orders.get('last_order_date'),
+            'review_count': reviews.get('review_count', 0),
         }
-        return self.create(data)
-    
+        if archived:
+            stats['archived_order_date'] = archived['archived_order_date']
+        self.collection.replace_one({'user_id': user_id}, stats, upsert=True)
+        return stats
+
+
+class RecommendationManager(BaseMongoModel):
+    indexes = [
+        IndexModel([('product_slug', ASCENDING)], name='product_unique', unique=True),
+    ]
+    checkpoint_id = 'recommendations'
+
+    def __init__(self):
+        super().__init__(RECOMMENDATIONS_COLLECTION)
+
+    def add_co_purchases(self, counts):
+        operations = [
+            UpdateOne(
+                {'product_slug': slug},
+                {'$inc': {f'counts.{other}': count for other, count in others.items()}},
+                upsert=True,
+            )
+            for slug, others in counts.items()
+        ]
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+
+    def refresh_neighbours(self, slugs, top_k):
+        operations = [
+            UpdateOne({'_id': recommendation['_id']}, {'$set': {
+                'neighbours': top_neighbours(recommendation.get('counts', {}), top_k),
+                'updated_at': datetime.now(),
+            }})
+            for recommendation in self.collection.find({'product_slug': {'$in': list(slugs)}}, {'counts': 1})
+        ]
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+
+    def checkpoint(self):
+        """The newest order date counted so far, and the recently counted orders as {id: date}."""
+        checkpoint = mongodb.database['job_checkpoints'].find_one({'_id': self.checkpoint_id}) or {}
+        if 'last_order_date' not in checkpoint and checkpoint.get('last_order_id'):
+            # Checkpoints from before dates were used: resume from that order's date.
+            order = mongodb.database['orders'].find_one({'_id': checkpoint['last_order_id']}, {'date': 1})
+            return (order['date'] if order else None), {}
+        recent = {order['_id']: order['date'] for order in checkpoint.get('recent_orders', [])}
+        return checkpoint.get('last_order_date'), recent
+
+    def save_checkpoint(self, last_order_date, recent):
+        mongodb.database['job_checkpoints'].update_one(
+            {'_id': self.checkpoint_id},
+            {
+                '$set': {
+                    'last_order_date': last_order_date,
+                    'recent_orders': [{'_id': order_id, 'date': date} for order_id, date in recent.items()],
+                },
+                '$unset': {'last_order_id': ''},
+            },
+            upsert=True,
+        )
+
+    def reset(self):
+        self.collection.delete_many({})
+        mongodb.database['job_checkpoints'].delete_one({'_id': self.checkpoint_id})
+
+
+def stock_tracked(product):
+    return product is not None and product.get('stock') is not None
+
+
+class CartAlreadyCheckedOut(Exception):
+    pass
+
+
+def snapshot_order_item(item, product):
+    title = product['title'] if product else item.get('title', item['product_slug'])
+    price = product['price'] if product else item.get('price', 0)
+    return {
+        'product_slug': item['product_slug'],
+        'title': title,
+        'quantity': item['quantity'],
+        'price': price,
+        'total_amount': price * item['quantity'],
+    }
+
+
+def all_managers():
+    return [manager_class() for manager_class in BaseMongoModel.__subclasses__()]
+
 
 categories = CategoryManager()
 products = ProductManager()
 reviews = ReviewManager()
 carts = CartManager()
-orders = OrderManager()
\ No newline at end of file
+orders = OrderManager()
+user_stats = UserStatsManager()
\ No newline at end of file
@@ -0,0 +1,139 @@
+import hashlib
+import re
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe, urlencode
+
+from honey_api.catalog_cache import catalog_cache
+
+DEFAULT_SETTINGS = {
+    'cache': 'default',
+    'timeout': 300,
+}
+
+CACHED_PARAMS = ('q', 'category', 'sort', 'page')
+CATALOG_NAMESPACES = ('products', 'categories')
+
+# Cached pages are shared between visitors, so the CSRF token is swapped for a
+# placeholder on the way in and for the visitor's own token on the way out.
+CSRF_INPUT = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+CSRF_PLACEHOLDER = b'__csrf_token__'
+
+
+def page_cache_settings():
+    return dict(DEFAULT_SETTINGS, **getattr(settings, 'PAGE_CACHE', {}))
+
+
+def normalized_params(request, params):
+    values = []
+    for name in params:
+        value = ' '.join(request.GET.get(name, '').split())
+        if value and not (name == 'page' and value == '1'):
+            values.append((name, value))
+    return urlencode(values)
+
+
+def page_cache_key(request, params, versions):
+    # The versions come from the MongoDB version store, so an edit made by
+    # any worker or command moves every worker's pages to new keys.
+    digest = hashlib.md5(f"{request.path}?{normalized_params(request, params)}".encode()).hexdigest()
+    return f"catalog_page:{':'.join(map(str, versions))}:{digest}"
+
+
+def is_cacheable(request):
+    if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+        return False
+    # len() reads the pending messages without marking them as shown.
+    messages = getattr(request, '_messages', None)
+    return not (messages is not None and len(messages))
+
+
+def make_entry(response):
+    content = CSRF_INPUT.sub(rb'\g<1>' + CSRF_PLACEHOLDER + rb'\g<2>', response.content)
+    # Views may set Last-Modified from the data they show; otherwise the page
+    # is as old as this entry, since any catalog write moves to a new key.
+    last_modified = parse_http_date_safe(response.get('Last-Modified', '')) or int(time.time())
+    return {
+        'content': content,
+        'content_type': response['Content-Type'],
+        'etag': f'"{hashlib.md5(content).hexdigest()}"',
+        'last_modified': last_modified,
+    }
+
+
+def serve_entry(request, entry):
+    response = HttpResponse(
+        entry['content'].replace(CSRF_PLACEHOLDER, get_token(request).encode()),
+        content_type=entry['content_type'],
+    )
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    # Browsers keep the page but revalidate it, which costs a 304 at most.
+    patch_cache_control(response, no_cache=True)
+    return get_conditional_response(
+        request, etag=entry['etag'], last_modified=entry['last_modified'], response=response,
+    )
+
+
+def cache_catalog_page(extra_params=(), namespaces=None):
+    """
+    Cache the HTML of a catalog view for anonymous visitors, keyed by path,
+    the normalized query parameters and the catalog versions, and answer
+    conditional requests with 304s.
+
+    `namespaces`, called with the view's URL arguments, names further
+    catalog cache namespaces the page depends on (e.g. one product's).
+    """
+    params = CACHED_PARAMS + tuple(extra_params)
+
+    def page_namespaces(kwargs):
+        return CATALOG_NAMESPACES + (tuple(namespaces(**kwargs)) if namespaces else ())
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if not await sync_to_async(is_cacheable)(request):
+                    return await view(request, *args, **kwargs)
+
+                options = page_cache_settings()
+                cache = caches[options['cache']]
+                key = page_cache_key(request, params, await catalog_cache.aversions(*page_namespaces(kwargs)))
+                entry = await cache.aget(key)
+                if entry is None:
+                    response = await view(request, *args, **kwargs)
+                    if response.status_code != 200 or response.streaming:
+                        return response
+                    entry = make_entry(response)
+                    await cache.aset(key, entry, options['timeout'])
+                return serve_entry(request, entry)
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not is_cacheable(request):
+                return view(request, *args, **kwargs)
+
+            options = page_cache_settings()
+            cache = caches[options['cache']]
+            key = page_cache_key(request, params, catalog_cache.versions(*page_namespaces(kwargs)))
+            entry = cache.get(key)
+            if entry is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200 or response.streaming:
+                    return response
+                entry = make_entry(response)
+                cache.set(key, entry, options['timeout'])
+            return serve_entry(request, entry)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,104 @@
+import base64
+
+from bson import ObjectId, json_util
+
+from honey_api.serializer import mongo_serializer
+
+SORT_FIELDS = ('title', 'price', 'rating')
+
+
+def parse_sort(sort_by):
+    sort_field = sort_by.lstrip('-') if sort_by else 'title'
+    if sort_field not in SORT_FIELDS:
+        sort_field = 'title'
+    sort_direction = -1 if sort_by and sort_by.startswith('-') else 1
+    return sort_field, sort_direction
+
+
+def encode_cursor(value, object_id):
+    # Extended JSON, so dates and ObjectIds round-trip as sort keys.
+    raw = json_util.dumps([value, str(object_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        value, object_id = json_util.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return value, ObjectId(object_id)
+    except Exception:
+        return None
+
+
+def seek_filter(sort_field, sort_direction, value, object_id):
+    """
+    Matches the documents that sort after (value, object_id).
+
+    Ascending, MongoDB sorts a missing or null field before any other value; a
+    range operator never matches null, so nulls are added or left out here.
+    """
+    op = '$gt' if sort_direction == 1 else '$lt'
+    same_value = {sort_field: value, '_id': {op: object_id}}
+    if value is None:
+        # Ascending, every non-null value is still to come; descending, only nulls are.
+        return {'$or': [same_value, {sort_field: {'$ne': None}}]} if sort_direction == 1 else same_value
+
+    after = [{sort_field: {op: value}}, same_value]
+    if sort_direction != 1:
+        after.append({sort_field: None})
+    return {'$or': after}
+
+
+class KeysetPage:
+    """
+    One page of a keyset (seek) query; deep pages cost the same as the first.
+
+    `fallbacks` returns further collections holding the rows that sort after
+    everything in `collection` (e.g. archives); it is only called when
+    `collection` cannot fill the page.
+    """
+
+    def __init__(self, collection, filters, sort_field, sort_direction, per_page, cursor=None, projection=None,
+                 serializer=mongo_serializer, fallbacks=None):
+        query, sort, position = self.seek(filters, sort_field, sort_direction, cursor)
+        documents = list(collection.find(query, projection, sort=sort).limit(per_page + 1))
+        if len(documents) <= per_page and fallbacks is not None:
+            for older in fallbacks():
+                documents += older.find(query, projection, sort=sort).limit(per_page + 1 - len(documents))
+                if len(documents) > per_page:
+                    break
+        self._set_page(documents, position, sort_field, per_page, serializer)
+
+    @classmethod
+    async def afetch(cls, collection, filters, sort_field, sort_direction, per_page, cursor=None, projection=None,
+                     serializer=mongo_serializer):
+        """The same page read through an async collection."""
+        query, sort, position = cls.seek(filters, sort_field, sort_direction, cursor)
+        documents = await collection.find(query, projection, sort=sort).limit(per_page + 1).to_list()
+        page = cls.__new__(cls)
+        page._set_page(documents, position, sort_field, per_page, serializer)
+        return page
+
+    @staticmethod
+    def seek(filters, sort_field, sort_direction, cursor):
+        query = dict(filters)
+        position = decode_cursor(cursor) if cursor else None
+        if position is not None:
+            value, object_id = position
+            query = {'$and': [filters, seek_filter(sort_field, sort_direction, value, object_id)]}
+        return query, [(sort_field, sort_direction), ('_id', sort_direction)], position
+
+    def _set_page(self, documents, position, sort_field, per_page, serializer):
+        self.has_next = len(documents) > per_page
+        documents = documents[:per_page]
+        self.has_previous = position is not None
+        self.next_cursor = encode_cursor(documents[-1].get(sort_field), documents[-1]['_id']) if self.has_next else None
+        self.object_list = serializer(documents)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
@@ -0,0 +1,44 @@
+import heapq
+from collections import Counter, defaultdict
+from itertools import combinations
+
+RECOMMENDATIONS_COLLECTION = 'product_recommendations'
+
+
+def co_purchase_counts(orders):
+    """Sparse co-purchase matrix: counts[a][b] is the number of orders containing both a and b."""
+    counts = defaultdict(Counter)
+    for order in orders:
+        slugs = sorted({item['product_slug'] for item in order.get('items', [])})
+        for first, second in combinations(slugs, 2):
+            counts[first][second] += 1
+            counts[second][first] += 1
+    return counts
+
+
+def top_neighbours(counts, top_k):
+    # Ties go to the lower slug so rebuilds are deterministic.
+    best = heapq.nsmallest(top_k, counts.items(), key=lambda pair: (-pair[1], pair[0]))
+    return [{'slug': slug, 'count': count} for slug, count in best]
+
+
+async def arelated_products(database, product, limit, projection=None):
+    """Up to `limit` products bought together with `product`, topped up from its category."""
+    recommendation = await database[RECOMMENDATIONS_COLLECTION].find_one(
+        {'product_slug': product['slug']}, {'neighbours': {'$slice': limit}},
+    )
+    slugs = [neighbour['slug'] for neighbour in (recommendation or {}).get('neighbours', [])]
+
+    related = []
+    if slugs:
+        found = await database['products'].find({'slug': {'$in': slugs}}, projection).to_list()
+        rank = {slug: position for position, slug in enumerate(slugs)}
+        related = sorted(found, key=lambda related_product: rank[related_product['slug']])
+
+    if len(related) < limit:
+        exclude = [product['_id']] + [related_product['_id'] for related_product in related]
+        related += await database['products'].find(
+            {'category_id': product['category_id'], '_id': {'$nin': exclude}}, projection,
+        ).limit(limit - len(related)).to_list()
+
+    return related
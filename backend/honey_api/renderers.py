@@ -0,0 +1,46 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from bson import Decimal128, ObjectId
+from django.utils.functional import Promise
+from rest_framework.renderers import BaseRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_value(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal128):
+        value = value.to_decimal()
+    if isinstance(value, Decimal):
+        # As a string, like DRF's own encoder, so no precision is lost.
+        return str(value)
+    if isinstance(value, Promise):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class MongoJSONRenderer(BaseRenderer):
+    """
+    Renders MongoDB documents as they come back from pymongo: ObjectIds and
+    decimals become strings and datetimes ISO 8601. Uses orjson when it is
+    installed.
+    """
+
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is not None:
+            return orjson.dumps(data, default=encode_value, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(data, default=encode_value, ensure_ascii=False, separators=(',', ':')).encode()
@@ -0,0 +1,76 @@
+import re
+
+from mongodb_connector import mongodb
+from honey_api.serializer import mongo_serializer
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+MIN_PREFIX = 2
+MAX_PREFIX = 15
+
+TEXT_WEIGHTS = {'title': 10, 'category_name': 5, 'description': 1}
+RELEVANCE_SORT = [('score', {'$meta': 'textScore'}), ('_id', 1)]
+
+
+def tokenize(text):
+    return WORD_RE.findall((text or '').lower())
+
+
+def search_prefixes(title):
+    prefixes = set()
+    for word in tokenize(title):
+        for length in range(MIN_PREFIX, min(len(word), MAX_PREFIX) + 1):
+            prefixes.add(word[:length])
+    return sorted(prefixes)
+
+
+def search_fields(title, category_name):
+    return {
+        'category_name': category_name or '',
+        'search_prefixes': search_prefixes(title),
+    }
+
+
+class ProductSearch:
+    """
+    Builds the filter and ordering for a product search.
+
+    The last term may still be half typed, so it is matched against the
+    title prefixes. The terms before it go through the `search_text` index,
+    which stems them and ranks by relevance over title, category name and
+    description. Both parts are one query, so other filters (e.g. the
+    category) apply to the search as a whole.
+    """
+
+    def __init__(self, query, filters=None):
+        self.query = (query or '').strip()
+        self.filters = dict(self.filters_for(tokenize(self.query)), **(filters or {}))
+        self.relevance = '$text' in self.filters
+
+    @staticmethod
+    def filters_for(terms):
+        if not terms:
+            return {}
+
+        *words, partial = terms
+        filters = {'search_prefixes': partial[:MAX_PREFIX]}
+        if words:
+            filters['$text'] = {'$search': ' '.join(words)}
+        return filters
+
+    @property
+    def sort(self):
+        return RELEVANCE_SORT if self.relevance else None
+
+    @property
+    def projection(self):
+        return {'score': {'$meta': 'textScore'}} if self.relevance else None
+
+    def results(self, limit=20, projection=None):
+        if self.relevance:
+            projection = dict(projection or {}, **self.projection)
+        cursor = mongodb.database['products'].find(self.filters, projection, sort=self.sort or [('title', 1)])
+        return mongo_serializer(cursor.limit(limit))
+
+
+def search_products(query, filters=None, limit=20, projection=None):
+    return ProductSearch(query, filters).results(limit, projection)
@@ -1,10 +1,11 @@
 from bson import ObjectId
 from datetime import datetime
 from pymongo.cursor import Cursor
-from mongodb_connector import mongodb
 
 from core.models import User
-from honey_api.utils import get_object_id
+from honey_api.utils import SHIPPING_AMOUNT, TAX_AMOUNT, get_object_id
+from honey_api.loaders import ProductLoader
+from honey_api.catalog_cache import get_category
 
 def mongo_serializer(doc):
     if doc is None:
@@ -35,13 +36,63 @@ def mongo_serializer(doc):
     
     return doc
 
-def cart_serializer(cart):
+class DocumentSerializer:
+    """
+    Serializer for documents of a known shape. Only `_id` and the listed
+    ObjectId fields are converted, nested documents go through their own
+    serializer, and every other value (datetimes included) is copied as is.
+    """
+
+    def __init__(self, object_id_fields=(), nested=None):
+        self.object_id_fields = tuple(object_id_fields)
+        self.nested = tuple((nested or {}).items())
+
+    def __call__(self, doc):
+        if doc is None:
+            return None
+
+        data = dict(doc)
+        if '_id' in data:
+            data['id'] = str(data.pop('_id'))
+        for field in self.object_id_fields:
+            value = data.get(field)
+            if value is not None:
+                data[field] = str(value)
+        for field, serializer in self.nested:
+            value = data.get(field)
+            if isinstance(value, list):
+                data[field] = [serializer(item) for item in value]
+            elif value is not None:
+                data[field] = serializer(value)
+        return data
+
+    def many(self, docs):
+        return [self(doc) for doc in docs]
+
+# Fields the product cards (index, shop, related products) actually render.
+PRODUCT_CARD_PROJECTION = {
+    'title': 1, 'slug': 1, 'price': 1, 'description': 1, 'category_id': 1,
+    'category_name': 1, 'rating': 1, 'review_count': 1,
+}
+REVIEW_PROJECTION = {'user_id': 1, 'rating': 1, 'comment': 1, 'date': 1}
+
+product_document_serializer = DocumentSerializer(object_id_fields=('category_id',))
+category_document_serializer = DocumentSerializer(object_id_fields=('parent_id',))
+order_document_serializer = DocumentSerializer(nested={'items': DocumentSerializer()})
+
+def cart_serializer(cart, loader=None):
+    loader = loader or ProductLoader()
+    products = loader.prime_cart(cart)
+
     context = cart
     items = [] 
     cart['subtotal'] = 0
     
     for item in cart['items']:
-        product = mongodb.database['products'].find_one({"slug": item['product_slug']})
+        product = products[item['product_slug']]
+        if product is None:
+            continue
+
         item_data = {
             'title': product['title'], 
             'slug': product['slug'], 
@@ -49,21 +100,24 @@ def cart_serializer(cart):
             'quantity': item['quantity'], 
             'total_amount': item['quantity'] * product['price'] 
         }
-        cart['subtotal'] = item_data['total_amount']
+        cart['subtotal'] += item_data['total_amount']
         items.append(item_data)
     
     cart['items'] = items
     cart['cart_id'] = cart['_id']
-    cart['shipping'] = 6
-    cart['tax'] = 5
+    cart['shipping'] = SHIPPING_AMOUNT
+    cart['tax'] = TAX_AMOUNT
     cart['total'] = cart['subtotal'] + cart['shipping'] + cart['tax']
     return context
 
-def review_serializer(reviews):
+def review_serializer(reviews, users=None):
     context = []
+    reviews = list(reviews)
+    if users is None:
+        users = User.objects.in_bulk({review['user_id'] for review in reviews})
 
     for review in reviews:
-        username = User.objects.get(id=review['user_id'])
+        username = users.get(review['user_id'])
         rev = {
             'username': username,
             'rating': review['rating'],
@@ -74,33 +128,50 @@ def review_serializer(reviews):
 
     return context
 
-def product_serializer(product):
-    context = mongo_serializer(product)
+async def areview_serializer(reviews):
+    users = await User.objects.ain_bulk({review['user_id'] for review in reviews})
+    return review_serializer(reviews, users)
+
+def product_serializer(product, category=None):
+    context = product_document_serializer(product)
 
-    category_id = get_object_id(product['category_id'])
-    category = mongodb.database['categories'].find_one({'_id':category_id})
+    if category is None:
+        category_id = get_object_id(product['category_id'])
+        category = get_category(category_id)
     
     context['category_slug'] = category['slug']
     context['category_name'] = category['name']
 
     return context
 
-def order_serializer(orders):
-    orders = mongo_serializer(orders)
+def order_serializer(orders, loader=None):
+    orders = order_document_serializer.many(orders)
     total_spend = 0
 
+    # Orders placed before item snapshots existed still need their products looked up.
+    legacy_slugs = [
+        item['product_slug'] for order in orders for item in order['items'] if 'title' not in item
+    ]
+    products = (loader or ProductLoader()).load_many(legacy_slugs) if legacy_slugs else {}
+
     for order_index in range(len(orders)):
         order_data = []
            
         total_spend += orders[order_index]['total_amount']
 
         for item in orders[order_index]['items']:
-            product = mongodb.database['products'].find_one({'slug': item['product_slug']})
+            if 'title' not in item:
+                product = products[item['product_slug']]
+                if product is None:
+                    continue
+                item = {'title': product['title'], 'price': product['price'], 'quantity': item['quantity']}
+                item['total_amount'] = item['price'] * item['quantity']
+
             data = {
-                'name': product['title'],
+                'name': item['title'],
                 'quantity': item['quantity'],
-                'price': product['price'],
-                'total_amount': product['price'] * item['quantity'],
+                'price': item['price'],
+                'total_amount': item['total_amount'],
             }
             order_data.append(data)
 
@@ -0,0 +1,65 @@
+from contextlib import contextmanager
+
+from django.db import connections
+
+from mongodb_monitoring import active_recorder
+from honey_api.middleware import QueryRecorder, install_sql_recorder
+
+# Upper bounds on (MongoDB commands, SQL queries) per request for a logged in
+# shopper with a three item cart and a warm catalog cache, as measured by
+# honey_api.tests; SQL includes the session and user lookups. Checkout and
+# create_order take one stock write per cart item.
+VIEW_QUERY_BUDGETS = {
+    'index': (2, 2),
+    'shop': (2, 2),
+    'product_detail': (4, 2),
+    'add_to_cart': (2, 2),
+    'cart': (2, 2),
+    'checkout': (5, 3),
+    'profile': (2, 3),
+    'create_order': (9, 2),
+}
+
+# The same for a catalog page served with an empty catalog cache, e.g. just
+# after a deploy or a catalog edit.
+COLD_VIEW_QUERY_BUDGETS = {
+    'index': (3, 2),
+    'shop': (4, 2),
+    'product_detail': (6, 2),
+}
+
+
+@contextmanager
+def record_queries():
+    for connection in connections.all(initialized_only=True):
+        install_sql_recorder(connection)
+
+    recorder = QueryRecorder(parent=active_recorder.get())
+    token = active_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        active_recorder.reset(token)
+
+
+class QueryBudgetMixin:
+    """TestCase mixin that fails a test when a block makes more database calls than budgeted."""
+
+    @contextmanager
+    def assertQueryBudget(self, mongo=None, sql=None):
+        with record_queries() as recorder:
+            yield recorder
+
+        over = []
+        if mongo is not None and recorder.count('mongo') > mongo:
+            over.append(f"{recorder.count('mongo')} MongoDB commands > {mongo}")
+        if sql is not None and recorder.count('sql') > sql:
+            over.append(f"{recorder.count('sql')} SQL queries > {sql}")
+        if over:
+            self.fail(f"Query budget exceeded: {'; '.join(over)} ({recorder.summary()})")
+
+    def assertViewQueryBudget(self, view_name, request, cold=False):
+        """Run `request` (e.g. lambda: self.client.get(url)) against the budget of `view_name`."""
+        mongo, sql = (COLD_VIEW_QUERY_BUDGETS if cold else VIEW_QUERY_BUDGETS)[view_name]
+        with self.assertQueryBudget(mongo=mongo, sql=sql):
+            return request()
@@ -1,3 +1,481 @@
-from django.test import TestCase
+import json
+import unittest
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
 
-# Create your tests here.
+from bson import Decimal128, ObjectId
+from django.conf import settings
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from rest_framework.exceptions import ValidationError
+
+from mongodb_connector import mongodb
+from core.models import Address, User
+from honey_api.api import projection_for, requested_fields, sparse
+from honey_api.catalog_cache import catalog_cache, get_product, product_namespace
+from honey_api.facets import ProductFacets, filter_query, parse_price, parse_rating
+from honey_api.mongo_models import CategoryManager, OrderManager, ProductManager, ReviewManager, UserStatsManager, carts
+from honey_api.pagination import KeysetPage, seek_filter
+from honey_api.recommendations import co_purchase_counts, top_neighbours
+from honey_api.search import ProductSearch
+from honey_api.renderers import MongoJSONRenderer
+from honey_api.serializer import DocumentSerializer
+from honey_api.testing import COLD_VIEW_QUERY_BUDGETS, VIEW_QUERY_BUDGETS, QueryBudgetMixin
+from honey_api.utils import allocate_slugs, slug_for
+
+CART_ITEMS = 3
+
+
+class SeekFilterTests(SimpleTestCase):
+    object_id = ObjectId()
+
+    def test_ascending_continues_past_the_value(self):
+        self.assertEqual(seek_filter('price', 1, 10, self.object_id), {'$or': [
+            {'price': {'$gt': 10}},
+            {'price': 10, '_id': {'$gt': self.object_id}},
+        ]})
+
+    def test_descending_ends_with_the_nulls(self):
+        self.assertEqual(seek_filter('price', -1, 10, self.object_id), {'$or': [
+            {'price': {'$lt': 10}},
+            {'price': 10, '_id': {'$lt': self.object_id}},
+            {'price': None},
+        ]})
+
+    def test_ascending_from_a_null_reaches_every_value(self):
+        self.assertEqual(seek_filter('price', 1, None, self.object_id), {'$or': [
+            {'price': None, '_id': {'$gt': self.object_id}},
+            {'price': {'$ne': None}},
+        ]})
+
+    def test_descending_from_a_null_only_has_nulls_left(self):
+        self.assertEqual(seek_filter('price', -1, None, self.object_id), {'price': None, '_id': {'$lt': self.object_id}})
+
+
+class ProductSearchTests(SimpleTestCase):
+    def test_last_term_is_matched_as_a_prefix(self):
+        search = ProductSearch('Raw  ho')
+        self.assertEqual(search.filters, {'search_prefixes': 'ho', '$text': {'$search': 'raw'}})
+        self.assertTrue(search.relevance)
+
+    def test_single_term_is_a_prefix_search(self):
+        search = ProductSearch('mAnu', {'category_id': 1})
+        self.assertEqual(search.filters, {'search_prefixes': 'manu', 'category_id': 1})
+        self.assertFalse(search.relevance)
+        self.assertIsNone(search.projection)
+
+    def test_no_terms_no_search(self):
+        self.assertEqual(ProductSearch('  ?! ', {'status': 'active'}).filters, {'status': 'active'})
+
+
+class SlugTests(SimpleTestCase):
+    def test_first_position_is_the_bare_slug(self):
+        self.assertEqual(slug_for('raw-honey', 1), 'raw-honey')
+        self.assertEqual(slug_for('raw-honey', 3), 'raw-honey-2')
+
+
+class CoPurchaseTests(SimpleTestCase):
+    def test_counts_each_pair_once_per_order(self):
+        counts = co_purchase_counts([
+            {'items': [{'product_slug': 'acacia'}, {'product_slug': 'manuka'}, {'product_slug': 'acacia'}]},
+            {'items': [{'product_slug': 'manuka'}, {'product_slug': 'acacia'}, {'product_slug': 'clover'}]},
+            {'items': [{'product_slug': 'clover'}]},
+            {},
+        ])
+        self.assertEqual(dict(counts['acacia']), {'manuka': 2, 'clover': 1})
+        self.assertEqual(dict(counts['manuka']), {'acacia': 2, 'clover': 1})
+        self.assertEqual(dict(counts['clover']), {'acacia': 1, 'manuka': 1})
+
+    def test_top_neighbours_breaks_ties_on_slug(self):
+        neighbours = top_neighbours({'manuka': 2, 'clover': 1, 'acacia': 1}, 2)
+        self.assertEqual(neighbours, [{'slug': 'manuka', 'count': 2}, {'slug': 'acacia', 'count': 1}])
+
+
+class FacetTests(SimpleTestCase):
+    def test_parse_price_accepts_only_bucket_values(self):
+        self.assertEqual(parse_price('10-20'), (10, 20))
+        self.assertEqual(parse_price('50-'), (50, None))
+        self.assertIsNone(parse_price('10-15'))
+        self.assertIsNone(parse_price(None))
+
+    def test_parse_rating_accepts_only_thresholds(self):
+        self.assertEqual(parse_rating('4'), 4)
+        self.assertIsNone(parse_rating('5'))
+        self.assertIsNone(parse_rating('x'))
+
+    def test_filter_query_applies_changes_and_starts_paging_over(self):
+        params = {'q': 'raw', 'category': 'wildflower', 'price': '10-20', 'page': '3'}
+        self.assertEqual(filter_query(params, price=None), 'q=raw&category=wildflower')
+        self.assertEqual(filter_query(params, rating=4), 'q=raw&category=wildflower&price=10-20&rating=4')
+
+    def test_selections_narrow_the_base_filters(self):
+        facets = ProductFacets({'status': 'active'}, price=(50, None), rating=3)
+        self.assertEqual(facets.filters(), {'$and': [
+            {'status': 'active'}, {'price': {'$gte': 50}}, {'rating': {'$gte': 3}},
+        ]})
+        self.assertEqual(ProductFacets({'status': 'active'}).filters(), {'status': 'active'})
+
+    def test_only_searches_are_selective(self):
+        self.assertFalse(ProductFacets({'status': 'active'}).selective)
+        self.assertTrue(ProductFacets({'$text': {'$search': 'raw'}}).selective)
+        self.assertTrue(ProductFacets({'search_prefixes': 'ra'}).selective)
+
+
+class DocumentSerializerTests(SimpleTestCase):
+    def test_converts_ids_and_nested_documents(self):
+        category_id, item_id, order_id = ObjectId(), ObjectId(), ObjectId()
+        date = datetime(2024, 5, 1, 12, 30)
+        serializer = DocumentSerializer(object_id_fields=('category_id',), nested={'items': DocumentSerializer()})
+
+        data = serializer({
+            '_id': order_id, 'category_id': category_id, 'date': date,
+            'items': [{'_id': item_id, 'quantity': 2}],
+        })
+        self.assertEqual(data, {
+            'id': str(order_id), 'category_id': str(category_id), 'date': date,
+            'items': [{'id': str(item_id), 'quantity': 2}],
+        })
+
+    def test_leaves_missing_fields_missing(self):
+        serializer = DocumentSerializer(object_id_fields=('category_id',), nested={'items': DocumentSerializer()})
+        self.assertEqual(serializer({'title': 'Clover'}), {'title': 'Clover'})
+        self.assertIsNone(serializer(None))
+
+
+class FieldSelectionTests(SimpleTestCase):
+    allowed = ('id', 'title', 'price')
+
+    def request(self, fields=None):
+        return SimpleNamespace(query_params={} if fields is None else {'fields': fields})
+
+    def test_projects_the_requested_fields(self):
+        fields = requested_fields(self.request(' title, id ,'), self.allowed)
+        self.assertEqual(fields, ['title', 'id'])
+        self.assertEqual(projection_for(fields, {'title': 1, 'price': 1}, 'slug'), {'title': 1, 'slug': 1})
+        self.assertEqual(sparse([{'id': '1', 'title': 'Clover', 'slug': 'clover'}], fields), [{'id': '1', 'title': 'Clover'}])
+
+    def test_all_fields_by_default(self):
+        self.assertIsNone(requested_fields(self.request(), self.allowed))
+        self.assertEqual(projection_for(None, {'title': 1}), {'title': 1})
+
+    def test_rejects_unknown_fields(self):
+        with self.assertRaises(ValidationError) as raised:
+            requested_fields(self.request('title,stock,reservations'), self.allowed)
+        self.assertIn('reservations, stock', str(raised.exception.detail['fields']))
+
+
+class MongoJSONRendererTests(SimpleTestCase):
+    def test_renders_bson_and_python_types(self):
+        object_id = ObjectId()
+        rendered = MongoJSONRenderer().render({
+            'id': object_id, 'price': Decimal('12.50'), 'cost': Decimal128('3.10'),
+            'date': datetime(2024, 5, 1, 12, 30), 'tags': ['raw'],
+        })
+        self.assertEqual(json.loads(rendered), {
+            'id': str(object_id), 'price': '12.50', 'cost': '3.10', 'date': '2024-05-01T12:30:00', 'tags': ['raw'],
+        })
+
+    def test_rejects_unknown_types(self):
+        with self.assertRaises(TypeError):
+            MongoJSONRenderer().render({'value': object()})
+
+    def test_renders_nothing_for_none(self):
+        self.assertEqual(MongoJSONRenderer().render(None), b'')
+
+
+def mongodb_available():
+    try:
+        client = MongoClient(settings.MONGODB_SETTINGS['host'], serverSelectionTimeoutMS=500)
+        try:
+            client.admin.command('ping')
+        finally:
+            client.close()
+        return True
+    except PyMongoError:
+        return False
+
+
+class MongoTestCase(TestCase):
+    """
+    Runs against a throwaway `<db>_test` MongoDB database holding a small
+    catalog; skipped when no MongoDB server answers.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        if not mongodb_available():
+            raise unittest.SkipTest('MongoDB is not reachable')
+        super().setUpClass()
+
+        cls.original_mongo_settings = settings.MONGODB_SETTINGS
+        settings.MONGODB_SETTINGS = dict(cls.original_mongo_settings, db=f"{cls.original_mongo_settings['db']}_test")
+        mongodb.close()
+        mongodb.database.client.drop_database(settings.MONGODB_SETTINGS['db'])
+        call_command('ensure_indexes', verbosity=0)
+
+        category = CategoryManager().create_category('Raw Honey')
+        cls.products = ProductManager().create_products([
+            {
+                'title': f'Test Honey {index}', 'category_id': category['_id'], 'price': 10 + index,
+                'description': 'Test product', 'stock': 100,
+            }
+            for index in range(8)
+        ])
+
+    @classmethod
+    def tearDownClass(cls):
+        mongodb.database.client.drop_database(settings.MONGODB_SETTINGS['db'])
+        mongodb.close()
+        settings.MONGODB_SETTINGS = cls.original_mongo_settings
+        super().tearDownClass()
+
+    def setUp(self):
+        # The LRU outlives a test, but the versions it is keyed by start over with the database.
+        catalog_cache.local.clear()
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'password')
+        self.address = Address.objects.create(
+            user=self.user, name='Home', address='1 Hive Lane', city='Springfield',
+            state='State', postal_code='12345', is_default=True,
+        )
+        self.client.force_login(self.user)
+        for product in self.products[:CART_ITEMS]:
+            carts.add_item(self.user.id, product['slug'], 1, product['price'])
+
+    def tearDown(self):
+        mongodb.database['carts'].delete_many({})
+        mongodb.database['orders'].delete_many({})
+        mongodb.database['user_stats'].delete_many({})
+
+
+class ViewQueryBudgetTests(QueryBudgetMixin, MongoTestCase):
+    """
+    Each storefront view stays within its VIEW_QUERY_BUDGETS entry once the
+    catalog cache is warm, and catalog pages within COLD_VIEW_QUERY_BUDGETS
+    when it is empty.
+    """
+
+    def assertWarmBudget(self, view_name, request, status=200):
+        request()
+        response = self.assertViewQueryBudget(view_name, request)
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def assertColdBudget(self, view_name, request, status=200):
+        catalog_cache.local.clear()
+        response = self.assertViewQueryBudget(view_name, request, cold=True)
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def test_every_budgeted_view_is_covered(self):
+        tested = {name[len('test_'):] for name in dir(self) if name.startswith('test_')}
+        self.assertLessEqual(set(VIEW_QUERY_BUDGETS), tested)
+        self.assertLessEqual({f'{name}_cold' for name in COLD_VIEW_QUERY_BUDGETS}, tested)
+
+    def test_index(self):
+        self.assertWarmBudget('index', lambda: self.client.get(reverse('index')))
+
+    def test_index_cold(self):
+        self.assertColdBudget('index', lambda: self.client.get(reverse('index')))
+
+    def test_shop(self):
+        self.assertWarmBudget('shop', lambda: self.client.get(reverse('shop'), {'sort': 'price', 'page': 2}))
+
+    def test_shop_cold(self):
+        self.assertColdBudget('shop', lambda: self.client.get(reverse('shop'), {'sort': 'price', 'page': 2}))
+
+    def test_product_detail(self):
+        slug = self.products[0]['slug']
+        self.assertWarmBudget('product_detail', lambda: self.client.get(reverse('product_detail', args=[slug])))
+
+    def test_product_detail_cold(self):
+        slug = self.products[0]['slug']
+        self.assertColdBudget('product_detail', lambda: self.client.get(reverse('product_detail', args=[slug])))
+
+    def test_add_to_cart(self):
+        # Measured on a product not in the cart yet, the usual case, added from its page.
+        product = self.products[-1]
+        self.client.get(reverse('product_detail', args=[product['slug']]))
+        response = self.assertViewQueryBudget(
+            'add_to_cart',
+            lambda: self.client.post(reverse('add_to_cart'), {'product_slug': product['slug'], 'quantity': 1}),
+        )
+        self.assertEqual(response.status_code, 302)
+        cart = carts.get_or_empty(self.user.id)
+        self.assertEqual(len(cart['items']), CART_ITEMS + 1)
+
+    def test_add_to_cart_again(self):
+        product = self.products[0]
+        self.client.get(reverse('product_detail', args=[product['slug']]))
+        response = self.assertViewQueryBudget(
+            'add_to_cart',
+            lambda: self.client.post(reverse('add_to_cart'), {'product_slug': product['slug'], 'quantity': 1}),
+        )
+        self.assertEqual(response.status_code, 302)
+        cart = carts.get_or_empty(self.user.id)
+        self.assertEqual([item['quantity'] for item in cart['items']], [2] + [1] * (CART_ITEMS - 1))
+
+    def test_cart(self):
+        self.assertWarmBudget('cart', lambda: self.client.get(reverse('cart')))
+
+    def test_checkout(self):
+        self.assertWarmBudget('checkout', lambda: self.client.get(reverse('checkout')))
+
+    def test_profile(self):
+        self.assertWarmBudget('profile', lambda: self.client.get(reverse('profile')))
+
+    def test_create_order(self):
+        # A shopper's first order also builds their stats; the budget is for every order after it.
+        UserStatsManager().get_stats(self.user.id)
+        self.client.get(reverse('checkout'))
+        cart = carts.get_or_empty(self.user.id)
+        data = {'cart_id': str(cart['_id']), 'idempotency_key': uuid.uuid4().hex, 'saved_address': self.address.id}
+
+        response = self.assertViewQueryBudget('create_order', lambda: self.client.post(reverse('create_order'), data))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(mongodb.database['orders'].count_documents({'user_id': self.user.id}), 1)
+
+
+class SlugAllocationTests(MongoTestCase):
+    def test_skips_slugs_created_before_the_counter(self):
+        mongodb.database['slug_counters'].delete_many({'_id': 'products:wildflower-honey'})
+        mongodb.database['products'].insert_many([{'slug': 'wildflower-honey'}, {'slug': 'wildflower-honey-3'}])
+        self.addCleanup(mongodb.database['products'].delete_many, {'slug': {'$regex': '^wildflower-honey'}})
+
+        slugs = allocate_slugs('products', ['Wildflower Honey', 'Wildflower Honey', 'Clover & Lime'])
+        self.assertEqual(slugs[:2], ['wildflower-honey-4', 'wildflower-honey-5'])
+        self.assertEqual(allocate_slugs('products', ['Wildflower Honey']), ['wildflower-honey-6'])
+
+
+class KeysetPageTests(MongoTestCase):
+    def walk(self, collection, sort_direction):
+        seen, cursor = [], None
+        while True:
+            page = KeysetPage(collection, {}, 'price', sort_direction, 2, cursor=cursor, serializer=list)
+            seen += [document['name'] for document in page]
+            if not page.has_next:
+                return seen
+            cursor = page.next_cursor
+
+    def test_pages_through_missing_and_null_values_both_ways(self):
+        collection = mongodb.database['keyset_test']
+        self.addCleanup(collection.drop)
+        collection.insert_many([
+            {'name': 'b', 'price': 5}, {'name': 'missing'}, {'name': 'a', 'price': 3},
+            {'name': 'null', 'price': None}, {'name': 'c', 'price': 5},
+        ])
+
+        ascending = self.walk(collection, 1)
+        self.assertEqual(sorted(ascending[:2]), ['missing', 'null'])
+        self.assertEqual(ascending[2:], ['a', 'b', 'c'])
+
+        descending = self.walk(collection, -1)
+        self.assertEqual(descending[:3], ['c', 'b', 'a'])
+        self.assertEqual(sorted(descending[3:]), ['missing', 'null'])
+
+
+class PlaceOrderTests(MongoTestCase):
+    def place(self, idempotency_key):
+        cart = carts.get_or_empty(self.user.id)
+        return OrderManager().place_order(self.user.id, cart['_id'], self.address.id, idempotency_key)
+
+    def test_same_key_places_one_order(self):
+        key = uuid.uuid4().hex
+        order, created = self.place(key)
+        self.assertTrue(created)
+
+        again, created = self.place(key)
+        self.assertFalse(created)
+        self.assertEqual(again['_id'], order['_id'])
+        self.assertEqual(mongodb.database['orders'].count_documents({'user_id': self.user.id}), 1)
+        self.assertEqual(order['subtotal'], sum(product['price'] for product in self.products[:CART_ITEMS]))
+
+    def test_prices_come_from_the_catalog(self):
+        mongodb.database['carts'].update_one({'user_id': self.user.id}, {'$set': {'items.0.price': 0.01}})
+        order, _ = self.place(uuid.uuid4().hex)
+        self.assertEqual(order['items'][0]['price'], self.products[0]['price'])
+
+
+class StockTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.manager = ProductManager()
+        self.slug = self.products[0]['slug']
+        self.manager.restock({self.slug: 1}, replace=True)
+        self.addCleanup(self.manager.restock, {self.slug: 100}, replace=True)
+
+    def stock(self):
+        return mongodb.database['products'].find_one({'slug': self.slug})['stock']
+
+    def test_one_unit_sells_once(self):
+        sold = [self.manager.commit_stock(self.slug, 1, ObjectId()) for _ in range(2)]
+        self.assertEqual(sold, [True, False])
+        self.assertEqual(self.stock(), 0)
+
+    def test_one_unit_is_held_once(self):
+        first, second = ObjectId(), ObjectId()
+        expires_at = datetime.now() + timedelta(minutes=10)
+        self.assertTrue(self.manager.reserve_stock(self.slug, 1, first, expires_at))
+        self.assertFalse(self.manager.reserve_stock(self.slug, 1, second, expires_at))
+        self.assertEqual(self.stock(), 0)
+
+        self.assertTrue(self.manager.commit_stock(self.slug, 1, first))
+        self.assertFalse(self.manager.commit_stock(self.slug, 1, second))
+        self.assertEqual(self.stock(), 0)
+
+    def test_lapsed_hold_goes_to_the_next_buyer(self):
+        self.manager.reserve_stock(self.slug, 1, ObjectId(), datetime.now() - timedelta(minutes=1))
+        self.assertTrue(self.manager.commit_stock(self.slug, 1, ObjectId()))
+        self.assertEqual(self.stock(), 0)
+
+
+class ProfileOrdersTests(MongoTestCase):
+    def test_pages_through_every_order(self):
+        now = datetime.now()
+        mongodb.database['orders'].insert_many([
+            {
+                'user_id': self.user.id, 'items': [], 'total_amount': 10.0, 'order_status': 'processing',
+                'order_number': f'ORD-TEST-{index}', 'idempotency_key': f'test-{index}',
+                'date': now - timedelta(days=index),
+            }
+            for index in range(12)
+        ])
+
+        first = self.client.get(reverse('profile')).context['orders']
+        self.assertEqual([order['order_number'] for order in first], [f'ORD-TEST-{index}' for index in range(10)])
+        self.assertTrue(first.has_next)
+
+        response = self.client.get(reverse('profile'), {'cursor': first.next_cursor})
+        second = response.context['orders']
+        self.assertEqual([order['order_number'] for order in second], ['ORD-TEST-10', 'ORD-TEST-11'])
+        self.assertFalse(second.has_next)
+        self.assertContains(response, 'aria-label="Orders pagination"')
+
+
+class ReviewInvalidationTests(MongoTestCase):
+    def tearDown(self):
+        mongodb.database['reviews'].delete_many({})
+        super().tearDown()
+
+    def test_review_refreshes_only_its_product(self):
+        reviewed, other = self.products[1]['slug'], self.products[2]['slug']
+        get_product(reviewed), get_product(other)
+        self.client.logout()
+        self.client.get(reverse('product_detail', args=[reviewed]))
+        products_version = catalog_cache.version('products')
+        other_version = catalog_cache.version(product_namespace(other))
+
+        ReviewManager().create_review(self.user.id, reviewed, 4, 'Lovely')
+
+        self.assertEqual(catalog_cache.version('products'), products_version)
+        self.assertEqual(catalog_cache.version(product_namespace(other)), other_version)
+        product = get_product(reviewed)
+        self.assertEqual((product['review_count'], product['rating']), (1, 4))
+
+        # The anonymous page cache moves on to a new key as well.
+        response = self.client.get(reverse('product_detail', args=[reviewed]))
+        self.assertContains(response, 'Lovely')
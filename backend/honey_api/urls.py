@@ -20,9 +20,13 @@ urlpatterns = [
     path('cart/', views.cart_view, name='cart'),
     path('cart/add/', views.add_to_cart, name='add_to_cart'),
     path('cart/clear/', views.clear_cart, name='clear_cart'),
+    path('cart/update/<str:slug>/', views.update_cart_item, name='update_cart_item'),
     path('cart/remove/<str:slug>/', views.remove_from_cart, name='remove_from_cart'),
 
     path('checkout/', views.checkout, name='checkout'),
     path('orders/', views.get_orders, name='orders'),
     path('order/create/', views.create_order, name='create_order'),
+
+    path('metrics/mongo-pool/', views.mongo_pool_stats, name='mongo_pool_stats'),
+    path('metrics/queries/', views.query_stats, name='query_stats'),
 ]
\ No newline at end of file
@@ -1,34 +1,70 @@
 from mongodb_connector import mongodb
 from bson import ObjectId
+from collections import Counter
 from datetime import datetime
 from django.utils.text import slugify
+from pymongo import ReturnDocument
+import re
 import uuid
 
+
 def get_object_id(id_string):
     try:
         return ObjectId(id_string)
     except:
         return None
 
+def slug_for(base_slug, position):
+    return base_slug if position == 1 else f"{base_slug}-{position - 1}"
+
+def existing_slug_count(collection, base_slug):
+    # Anchored regex, so this is a range scan on the slug index.
+    pattern = f"^{re.escape(base_slug)}(-[0-9]+)?$"
+    highest = 0
+    for doc in mongodb.database[collection].find({'slug': {'$regex': pattern}}, {'slug': 1, '_id': 0}):
+        suffix = doc['slug'][len(base_slug) + 1:]
+        highest = max(highest, int(suffix) + 1 if suffix else 1)
+    return highest
+
+def reserve_slug_positions(collection, base_slug, count):
+    counters = mongodb.database['slug_counters']
+    counter_id = f"{collection}:{base_slug}"
+
+    counter = counters.find_one_and_update(
+        {'_id': counter_id},
+        {'$inc': {'seq': count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+
+    if counter['seq'] == count:
+        # First use of this base slug: skip past slugs created before the counter existed.
+        existing = existing_slug_count(collection, base_slug)
+        if existing:
+            counter = counters.find_one_and_update(
+                {'_id': counter_id},
+                {'$inc': {'seq': existing}},
+                return_document=ReturnDocument.AFTER,
+            )
+
+    last = counter['seq']
+    return range(last - count + 1, last + 1)
+
+def allocate_slugs(collection, titles):
+    """Assigns a unique slug to every title with one counter update per distinct base slug."""
+    base_slugs = [slugify(title) for title in titles]
+    positions = {}
+
+    for base_slug, count in Counter(base_slugs).items():
+        positions[base_slug] = iter(reserve_slug_positions(collection, base_slug, count))
+
+    return [slug_for(base_slug, next(positions[base_slug])) for base_slug in base_slugs]
+
 def generate_unique_slug(collection, title):
-    base_slug = slugify(title)
-    slug = base_slug
-    counter = 1
-    
-    while mongodb.database[collection].find_one({"slug": slug}):
-        slug = f"{base_slug}-{counter}"
-        counter += 1
-    
-    return slug
+    return allocate_slugs(collection, [title])[0]
 
 def generate_order_number():
     return f"ORD-{datetime.now().strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
 
-def cart_total_amount(cart):
-    total_amount = 0
-    for item in cart['items']:
-        product_slug = item['product_slug']
-        product_price = mongodb.database['products'].find_one({"slug":product_slug})['price']
-        total_amount += item['quantity'] * product_price
-
-    return total_amount
\ No newline at end of file
+SHIPPING_AMOUNT = 6
+TAX_AMOUNT = 5
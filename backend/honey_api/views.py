@@ -1,131 +1,279 @@
+import asyncio
+import uuid
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.core.paginator import Paginator
+from django.utils.http import http_date
 from core.models import Address
 from datetime import datetime
 from django.shortcuts import render, redirect
+from asgiref.sync import sync_to_async
 from django.contrib import messages
-from honey_api.serializer import mongo_serializer, cart_serializer, review_serializer, product_serializer, order_serializer
+from pymongo.errors import DuplicateKeyError
+from honey_api.serializer import (
+    cart_serializer, areview_serializer, product_serializer, order_serializer,
+    product_document_serializer, category_document_serializer, PRODUCT_CARD_PROJECTION, REVIEW_PROJECTION,
+)
 from mongodb_connector import mongodb
-from honey_api.utils import get_object_id, cart_total_amount
-
-from honey_api.mongo_models import CartManager, ReviewManager, OrderManager
+from honey_api.utils import get_object_id
+from honey_api.loaders import get_product_loader
+from honey_api.pagination import KeysetPage, parse_sort
+from honey_api.search import ProductSearch
+from honey_api.facets import ProductFacets, filter_query, parse_price, parse_rating
+from honey_api.recommendations import arelated_products
+from honey_api.catalog_cache import (
+    catalog_cache, aget_categories, aget_product, get_product, product_namespace,
+)
+from honey_api.page_cache import cache_catalog_page
+from honey_api.middleware import query_stats as request_query_stats
+
+from honey_api.mongo_models import ReviewManager, OrderManager, carts
 from core.serializers import AddressSerializer
 
+SHOP_PAGE_SIZE = 4
+REVIEWS_PAGE_SIZE = 10
+ORDERS_PAGE_SIZE = 10
+RELATED_PRODUCTS_LIMIT = 4
+IDEMPOTENCY_KEY_LENGTH = 64
+
+# Templates touch the lazy user and session, which need the sync ORM.
+arender = sync_to_async(render)
+
 
 @require_http_methods(["GET"])
-def index(request):
+@cache_catalog_page()
+async def index(request):
     try:
-        products = mongodb.database['products'].find().limit(3)
-        categories = mongodb.database['categories'].find()
+        products, categories = await asyncio.gather(
+            mongodb.async_database['products'].find(
+                projection=PRODUCT_CARD_PROJECTION, sort=[('rating', -1), ('_id', -1)],
+            ).limit(3).to_list(),
+            aget_categories(),
+        )
 
         context = {
-            'featured_products': mongo_serializer(products),
-            'categories': mongo_serializer(categories)
+            'featured_products': product_document_serializer.many(products),
+            'categories': category_document_serializer.many(categories),
+            'catalog_version': await catalog_cache.aversion('products'),
         }
-        return render(request, 'index.html', context)
+        return await arender(request, 'index.html', context)
 
     except Exception as e:
-        return render(request, '404.html', {'detail': str(e)}, status=404)
+        return await arender(request, '404.html', {'detail': str(e)}, status=404)
 
 
 @require_http_methods(["GET"])
-def category_list(request):
+@cache_catalog_page()
+async def category_list(request):
     try:
-        categories = mongodb.database['categories'].find()
+        categories = await aget_categories()
 
         context = {
-            'categories': mongo_serializer(categories)
+            'categories': category_document_serializer.many(categories)
         }
 
-        return render(request, 'index.html', context)
+        return await arender(request, 'index.html', context)
     except Exception as e:
-        return render(request, '404.html', {'detail': str(e)}, status=404)
+        return await arender(request, '404.html', {'detail': str(e)}, status=404)
 
 
 @require_http_methods(["GET"])
-def product_list(request):
+async def product_list(request):
     try:
-        products = mongodb.database['products'].find()
+        products = await mongodb.async_database['products'].find(projection=PRODUCT_CARD_PROJECTION).to_list()
 
         context = {
-            'products': mongo_serializer(products),
+            'products': product_document_serializer.many(products),
         }
 
-        return render(request, 'products.html', context)
+        return await arender(request, 'products.html', context)
 
     except Exception as e:
-        return render(request, '404.html', {'detail': str(e)}, status=404)
+        return await arender(request, '404.html', {'detail': str(e)}, status=404)
 
 
 @require_http_methods(["GET"])
-def product_detail(request, slug):
+@cache_catalog_page(extra_params=('reviews_page',), namespaces=lambda slug: [product_namespace(slug)])
+async def product_detail(request, slug):
     try:
-        product = mongodb.database['products'].find_one({"slug": slug})
-        reviews = mongodb.database['reviews'].find({"product_slug": slug})
-        related_products = mongodb.database['products'].find({
-            "category_id": product['category_id'],
-            "_id": {"$ne": product['_id']} 
-        })
+        product = await aget_product(slug)
+        database = mongodb.async_database
+
+        reviews_count = product.get('review_count')
+        if reviews_count is None:
+            reviews_count = await database['reviews'].count_documents({"product_slug": slug})
+
+        # Paginate a range to get the page bounds, then fetch only that page.
+        reviews_page = Paginator(range(reviews_count), REVIEWS_PAGE_SIZE).get_page(request.GET.get('reviews_page', 1))
+        reviews = database['reviews'].find(
+            {"product_slug": slug},
+            REVIEW_PROJECTION,
+            sort=[('date', -1), ('_id', -1)],
+        ).skip(reviews_page.start_index() - 1 if reviews_count else 0).limit(REVIEWS_PAGE_SIZE)
+
+        reviews, related_products, categories = await asyncio.gather(
+            reviews.to_list(),
+            arelated_products(database, product, RELATED_PRODUCTS_LIMIT, PRODUCT_CARD_PROJECTION),
+            aget_categories(),
+        )
+        reviews_page.object_list = reviews
+        category = next(
+            (category for category in categories if category['_id'] == product['category_id']), None
+        )
 
         context = {
-            'product': product_serializer(product),
-            'reviews': review_serializer(reviews),
-            'related_products': mongo_serializer(related_products)
+            'product': product_serializer(product, category),
+            'reviews': await areview_serializer(reviews_page.object_list),
+            'reviews_page': reviews_page,
+            'rating_histogram': [
+                (stars, product.get('rating_histogram', {}).get(stars, 0)) for stars in '54321'
+            ],
+            'related_products': product_document_serializer.many(related_products),
+            'catalog_version': await catalog_cache.aversion('products'),
         }
 
-        return render(request, 'product_detail.html', context)
+        response = await arender(request, 'product_detail.html', context)
+        if product.get('modified_at'):
+            response['Last-Modified'] = http_date(product['modified_at'].timestamp())
+        return response
         
     except Exception as e:
-        return render(request, '404.html', {'detail': str(e)}, status=404)
+        return await arender(request, '404.html', {'detail': str(e)}, status=404)
 
 
 @require_http_methods(["GET"])
-def shop(request):
+@cache_catalog_page(extra_params=('cursor', 'price', 'rating'))
+async def shop(request):
     try:
         search_query = request.GET.get('q')
         category_slug = request.GET.get('category')
-        sort_by = request.GET.get('sort', 'title')
+        sort_by = request.GET.get('sort')
         page_number = request.GET.get('page', 1)
-        
-        filters = {}
-        
-        if search_query:
-            filters['title'] = {'$regex': search_query, '$options': 'i'} 
-        
-        if category_slug:
-            category_obj = mongodb.database['categories'].find_one({'slug': category_slug})
-            if category_obj:
-                filters['category_id'] = category_obj['_id']
-        
-        sort_field = 'title' 
-        sort_direction = 1
-        if sort_by:
-            if sort_by.startswith('-'):
-                sort_field = sort_by[1:]
-                sort_direction = -1
+        price = parse_price(request.GET.get('price'))
+        rating = parse_rating(request.GET.get('rating'))
+
+        search = ProductSearch(search_query)
+        sort_field, sort_direction = parse_sort(sort_by)
+        products_collection = mongodb.async_database['products']
+        projection = dict(PRODUCT_CARD_PROJECTION, **(search.projection or {}))
+        # Read the versions once, before the concurrent lookups below need them.
+        catalog_version = await catalog_cache.aversion('products')
+        categories = asyncio.ensure_future(aget_categories())
+
+        async def load_products():
+            # Only a category filter has to wait for the categories.
+            category_obj = None
+            if category_slug:
+                category_obj = next(
+                    (category for category in await categories if category['slug'] == category_slug), None,
+                )
+            facets = ProductFacets(search.filters, category_obj['_id'] if category_obj else None, price, rating)
+            facets_key = 'facets:' + filter_query(
+                {'q': ' '.join(search.query.lower().split()), 'category': category_slug if category_obj else None},
+                price=request.GET.get('price') if price else None, rating=rating,
+            )
+
+            if 'cursor' in request.GET:
+                return await asyncio.gather(
+                    catalog_cache.aget_or_set('products', facets_key, lambda: facets.arun(products_collection)),
+                    KeysetPage.afetch(
+                        products_collection, facets.filters(), sort_field, sort_direction,
+                        SHOP_PAGE_SIZE, cursor=request.GET.get('cursor'), projection=projection,
+                        serializer=product_document_serializer.many,
+                    ),
+                )
+
+            if search.relevance and not sort_by:
+                sort = search.sort
             else:
-                sort_field = sort_by
-
-        products = mongodb.database['products'].find(filters, sort=[(sort_field, sort_direction)])
-        categories = mongodb.database['categories'].find()
+                sort = [(sort_field, sort_direction), ('_id', sort_direction)]
+            try:
+                start = (max(int(page_number), 1) - 1) * SHOP_PAGE_SIZE
+            except ValueError:
+                start = 0
+
+            def find_page(start):
+                return products_collection.find(
+                    facets.filters(), projection, sort=sort,
+                ).skip(start).limit(SHOP_PAGE_SIZE).to_list()
+
+            # On a miss for a search, the counts and the requested page come back
+            # from one aggregation; a plain listing pages with an indexed find.
+            prefetched = {}
+
+            async def load_counts():
+                if not facets.selective:
+                    return await facets.arun(products_collection)
+                counts = await facets.arun(
+                    products_collection, sort=sort, start=start, limit=SHOP_PAGE_SIZE, projection=projection,
+                )
+                prefetched[start] = counts.pop('page')
+                return counts
+
+            if facets.selective:
+                counts = await catalog_cache.aget_or_set('products', facets_key, load_counts)
+                documents = prefetched[start] if start in prefetched else await find_page(start)
+            else:
+                counts, documents = await asyncio.gather(
+                    catalog_cache.aget_or_set('products', facets_key, load_counts), find_page(start),
+                )
+
+            # Paginate a range for the page bounds; a page number out of range
+            # lands on another page, which is fetched on its own.
+            products_page = Paginator(range(counts['total']), SHOP_PAGE_SIZE).get_page(page_number)
+            page_start = products_page.start_index() - 1 if counts['total'] else 0
+            if page_start != start:
+                documents = await find_page(page_start)
+            products_page.object_list = product_document_serializer.many(documents)
+            return counts, products_page
+
+        categories, (counts, products_page) = await asyncio.gather(categories, load_products())
+
+        categories = category_document_serializer.many(categories)
+        for category in categories:
+            category['count'] = counts['categories'].get(category['id'], 0)
+            category['query'] = filter_query(request.GET, category=category['slug'])
+        for bucket in counts['prices']:
+            selected = request.GET.get('price') == bucket['value']
+            bucket['query'] = filter_query(request.GET, price=None if selected else bucket['value'])
+        for bucket in counts['ratings']:
+            selected = rating == bucket['value']
+            bucket['query'] = filter_query(request.GET, rating=None if selected else bucket['value'])
 
-        paginator = Paginator(list(mongo_serializer(products)), 4)
-        products_page = paginator.get_page(page_number)
-        
         context = {
             'products': products_page,
-            'categories': mongo_serializer(categories),
+            'categories': categories,
+            'facets': counts,
+            'all_categories_query': filter_query(request.GET, category=None),
+            'page_query': filter_query(request.GET),
+            'selected_price': request.GET.get('price') if price else None,
+            'selected_rating': rating,
             'search_query': search_query,
             'selected_category_slug': category_slug,
             'sort_by': sort_by,
+            'keyset': isinstance(products_page, KeysetPage),
+            'catalog_version': catalog_version,
         }
-        
-        return render(request, 'shop.html', context)
-        
+
+        return await arender(request, 'shop.html', context)
+
     except Exception as e:
-        return render(request, '404.html', {'detail': str(e)}, status=404)
+        return await arender(request, '404.html', {'detail': str(e)}, status=404)
+
+
+@require_http_methods(["GET"])
+@staff_member_required
+def mongo_pool_stats(request):
+    return JsonResponse(mongodb.pool_stats())
+
+
+@require_http_methods(["GET"])
+@staff_member_required
+def query_stats(request):
+    return JsonResponse(request_query_stats.snapshot())
 
 
 @require_http_methods(["POST"])
@@ -149,15 +297,10 @@ def contact(request):
 @require_http_methods(["GET"])
 def cart_view(request):
     try:
-        user_cart = mongodb.database['carts'].find_one({"user_id": request.user.id})
-
-        if not user_cart:
-            user_cart = CartManager()
-            user_cart.create_cart(request.user.id)        
-            user_cart = mongodb.database['carts'].find_one({"user_id": request.user.id})
+        user_cart = carts.get_or_empty(request.user.id)
 
         context = {
-            'cart': cart_serializer(user_cart)
+            'cart': cart_serializer(user_cart, get_product_loader(request))
         }
 
         return render(request, 'cart.html', context)
@@ -171,36 +314,16 @@ def cart_view(request):
 @login_required(login_url='login')
 def add_to_cart(request):
     try:
-        user_cart = mongodb.database['carts'].find_one({"user_id": request.user.id})
-
-        if not user_cart:
-            user_cart = CartManager()
-            user_cart.create_cart(request.user.id)        
-            user_cart = mongodb.database['carts'].find_one({"user_id": request.user.id})
-
         data = request.POST
         product_slug = data.get('product_slug')
         quantity = int(data.get('quantity'))
 
-        item_exists = False
-        for item in user_cart['items']:
-            if item['product_slug'] == product_slug: 
-                item['quantity'] += quantity
-                item_exists = True
-        
-        if not item_exists:
-            new_item = {
-                'product_slug': product_slug,
-                'quantity': quantity,
-            }
-            user_cart['items'].append(new_item)
-        
-        total_amount = cart_total_amount(user_cart)
-        
-        mongodb.database['carts'].update_one(
-            {"user_id": int(request.user.id)},
-            {"$set": {"items": user_cart['items'], "total_amount": total_amount}}
-        )
+        product = get_product(product_slug)
+        if product is None or quantity < 1:
+            messages.error(request, "This product can not be added to your cart.")
+            return redirect(request.META.get('HTTP_REFERER', '/'))
+
+        carts.add_item(request.user.id, product_slug, quantity, product['price'])
 
         messages.success(request, "Item successfully added to your cart.")
         return redirect(request.META.get('HTTP_REFERER', '/')) 
@@ -209,22 +332,25 @@ def add_to_cart(request):
         return render(request, '404.html', {'detail': str(e)}, status=500)
 
 
-@csrf_exempt
 @require_http_methods(["POST"])
 @login_required(login_url='login')
-def remove_from_cart(request, slug):
+def update_cart_item(request, slug):
     try:
-        user_cart = mongodb.database['carts'].find_one({'user_id': request.user.id})
-        items = []
+        carts.set_quantity(request.user.id, slug, int(request.POST.get('quantity')))
 
-        for item in user_cart['items']:
-            if item['product_slug'] != slug:
-                items.append(item)
+        messages.success(request, "Your cart has been updated.")
+        return redirect(request.META.get('HTTP_REFERER', '/')) 
+    except Exception as e:
+        messages.error(request, str(e))
+        return render(request, '404.html', {'detail': str(e)}, status=500)
 
-        mongodb.database['carts'].update_one(
-            {'user_id': request.user.id},
-            {"$set": {"items": items}} 
-        )
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@login_required(login_url='login')
+def remove_from_cart(request, slug):
+    try:
+        carts.remove_item(request.user.id, slug)
 
         messages.success(request, "Item successfully removed from your cart.")
         return redirect(request.META.get('HTTP_REFERER', '/')) 
@@ -238,18 +364,13 @@ def remove_from_cart(request, slug):
 @login_required(login_url='login')
 def clear_cart(request):
     try:
-        user_cart = mongodb.database['carts'].find_one({'user_id': request.user.id})
+        user_cart = carts.clear(request.user.id)
 
-        if len(user_cart['items']):
+        if user_cart and len(user_cart['items']):
             messages.success(request, "Your cart has been successfully cleared.")
         else:
             messages.success(request, "Your cart is already empty.")
 
-        mongodb.database['carts'].update_one(
-            {'user_id': request.user.id},
-            {"$set": {"items": []}} 
-        )
-
         return redirect(request.META.get('HTTP_REFERER', '/')) 
     except Exception as e:
         messages.error(request, str(e))
@@ -261,17 +382,13 @@ def clear_cart(request):
 def add_review(request):
     try:
         data = request.POST
-        existing = mongodb.database['reviews'].find_one({
-            "user_id": request.user.id,
-            "product_slug": data['product_slug']
-        }) 
 
-        if existing:
-            messages.success(request, "You have already reviewed this product.")
-        else:
+        try:
             review = ReviewManager()
             review.create_review(request.user.id, data['product_slug'], data['rating'], data['comment'])
             messages.success(request, "Your review has been added successfully.")
+        except DuplicateKeyError:
+            messages.success(request, "You have already reviewed this product.")
 
         return redirect(request.META.get('HTTP_REFERER', '/')) 
 
@@ -285,16 +402,22 @@ def add_review(request):
 def checkout(request):
     try:
         user_id = request.user.id
-        orders = mongodb.database['orders'].find({'user_id': user_id})
-        cart = mongodb.database['carts'].find_one({'user_id': user_id})
+        cart = carts.get_or_empty(user_id)
+
+        loader = get_product_loader(request)
+        short = carts.reserve(cart, loader.prime_cart(cart)) if cart['items'] else []
+        if short:
+            messages.warning(request, f"Not enough stock left for: {', '.join(short)}")
 
         addresses = Address.objects.filter(user=request.user)
         addresses_list = AddressSerializer(addresses, many=True).data
-        cart_data = cart_serializer(cart)
+        cart_data = cart_serializer(cart, loader)
 
         context = {
             'saved_addresses': addresses_list,
             'cart': cart_data,
+            # Reposting the same form (double-click, retry) must not place a second order.
+            'idempotency_key': uuid.uuid4().hex,
         }
 
         return render(request, 'checkout.html', context)
@@ -305,14 +428,17 @@ def checkout(request):
 
 @require_http_methods(["GET"])
 @login_required(login_url='login')
-def get_orders(request):
+def get_orders(request, stats=None):
+    """One keyset page of the user's orders, newest first; `?cursor=` moves to older ones."""
     try:
-        user_id = request.user.id
-        orders = mongodb.database['orders'].find({'user_id': user_id})
-        return order_serializer(orders)
+        page = OrderManager().history(
+            request.user.id, ORDERS_PAGE_SIZE, cursor=request.GET.get('cursor'), stats=stats,
+        )
+        _, page.object_list = order_serializer(page.object_list, get_product_loader(request))
+        return page
     except Exception as e:
         messages.error(request, str(e))
-        return {}
+        return None
 
 
 @csrf_exempt
@@ -322,16 +448,14 @@ def create_order(request):
     try:
         data = request.POST
         cart_id = get_object_id(data['cart_id'])
-
-        user_id = request.user.id   
-        items = mongodb.database['carts'].find_one({'_id': cart_id})['items']
-        total_amount = data['total_amount']
+        # Old checkout pages post no key; they still get a single, if not retry-safe, order.
+        idempotency_key = data.get('idempotency_key', '').strip()[:IDEMPOTENCY_KEY_LENGTH] or uuid.uuid4().hex
         address_id = data['saved_address']
 
-        order = OrderManager()
-        order.create_order(user_id, items, total_amount, address_id)
-
-        mongodb.database['carts'].delete_one({"_id": cart_id}) 
+        order, created = OrderManager().place_order(request.user.id, cart_id, address_id, idempotency_key)
+        if not created:
+            messages.info(request, f"Order {order['order_number']} was already placed.")
+            return redirect('cart')
 
         messages.success(request, "Your order has been placed successfully!")
         return redirect('cart')
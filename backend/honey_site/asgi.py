@@ -0,0 +1,10 @@
+import os
+from django.core.asgi import get_asgi_application
+
+from mongodb_connector import mongodb
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'honey_site.settings')
+application = get_asgi_application()
+
+# The ASGI worker keeps one event loop alive, so its async client and pool are reused.
+mongodb.enable_async_client()
@@ -24,6 +24,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'honey_api.middleware.QueryAccountingMiddleware',
+    'honey_api.middleware.CatalogVersionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -53,6 +55,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'honey_site.wsgi.application'
+ASGI_APPLICATION = 'honey_site.asgi.application'
 
 DATABASES = {
     'default': {
@@ -65,7 +68,58 @@ DATABASES = {
 # MongoDB Settings - Local Development
 MONGODB_SETTINGS = {
     'host': 'mongodb://localhost:27017',
-    'db': 'honey_site'
+    'db': 'honey_site',
+    # Connection pool, sized per worker process
+    'max_pool_size': config('MONGODB_MAX_POOL_SIZE', default=50, cast=int),
+    'min_pool_size': config('MONGODB_MIN_POOL_SIZE', default=0, cast=int),
+    'max_idle_time_ms': config('MONGODB_MAX_IDLE_TIME_MS', default=60000, cast=int),
+    'wait_queue_timeout_ms': config('MONGODB_WAIT_QUEUE_TIMEOUT_MS', default=2000, cast=int),
+    'server_selection_timeout_ms': 5000,
+    # Wire compression, e.g. 'zlib' or 'zstd,zlib'; it only pays off across a slow
+    # link, so it is off unless set
+    'compressors': config('MONGODB_COMPRESSORS', default='') or None,
+    # Per-operation time limit, None disables it
+    'max_time_ms': config('MONGODB_MAX_TIME_MS', default=0, cast=int) or None,
+}
+
+# Catalog cache: a per-process LRU, optionally backed by a shared cache
+# alias from CACHES. Invalidation does not depend on it: the cache versions
+# are kept in MongoDB (catalog_versions) and seen by every worker.
+CATALOG_CACHE = {
+    'max_entries': 1024,
+    'timeout': 300,
+    'shared_cache': None,
+}
+
+# Whole-page cache for anonymous catalog pages. Keys embed the catalog
+# versions from MongoDB, so an edit invalidates the pages of every worker
+# whether this alias is per process (LocMem) or shared.
+PAGE_CACHE = {
+    'cache': 'default',
+    'timeout': 300,
+}
+
+# Carts untouched for cart_ttl_days are removed by a TTL index (run
+# ensure_indexes after changing it). archive_orders moves orders older than
+# order_archive_days into monthly orders_archive_YYYY_MM collections.
+DATA_RETENTION = {
+    'cart_ttl_days': 30,
+    'order_archive_days': 365,
+}
+
+# The checkout page holds the cart's stock this long. Lapsed holds are
+# handed back by the next hold on the product, whenever it runs short, and
+# by the release_reservations command (cron, or --loop every interval).
+INVENTORY = {
+    'reservation_minutes': 10,
+    'release_interval_seconds': 60,
+}
+
+# Per-request MongoDB/SQL call accounting. The Server-Timing header names
+# collections and tables, so it is only sent when enabled.
+QUERY_ACCOUNTING = {
+    'server_timing': config('SERVER_TIMING', default=DEBUG, cast=bool),
+    'repeat_threshold': 10,
 }
 
 CORS_ALLOW_CREDENTIALS = True
@@ -83,13 +137,13 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'django.contrib.auth.backends.ModelBackend',
+        'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'honey_api.renderers.MongoJSONRenderer',
     ],
 }
 
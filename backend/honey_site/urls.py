@@ -7,6 +7,7 @@ from django.contrib import admin
 urlpatterns = [
     path('', include('honey_api.urls')),
     path('user/', include('core.urls')),
+    path('api/v1/', include('honey_api.api_urls')),
     path('admin/', admin.site.urls),
 ]
 
@@ -1,45 +1,170 @@
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient, MongoClient
 from django.conf import settings
+import asyncio
 import logging
+import os
+import threading
+import weakref
+
+from mongodb_monitoring import command_stats, pool_stats
 
 logger = logging.getLogger(__name__)
 
+# MONGODB_SETTINGS key -> MongoClient keyword argument
+CLIENT_OPTIONS = {
+    'max_pool_size': 'maxPoolSize',
+    'min_pool_size': 'minPoolSize',
+    'max_idle_time_ms': 'maxIdleTimeMS',
+    'wait_queue_timeout_ms': 'waitQueueTimeoutMS',
+    'server_selection_timeout_ms': 'serverSelectionTimeoutMS',
+    'compressors': 'compressors',
+    # Client side operation timeout, sent to the server as maxTimeMS.
+    'max_time_ms': 'timeoutMS',
+}
+
+TRANSACTION_TOPOLOGIES = ('ReplicaSetWithPrimary', 'Sharded', 'LoadBalanced')
+
+
+class SyncBackedCursor:
+    """The part of the async cursor API the views use, over a sync cursor."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self._cursor.sort(*args, **kwargs)
+        return self
+
+    def skip(self, skip):
+        self._cursor.skip(skip)
+        return self
+
+    def limit(self, limit):
+        self._cursor.limit(limit)
+        return self
+
+    async def to_list(self, length=None):
+        return self._cursor.to_list(length)
+
+
+class SyncBackedCollection:
+    """The part of the async collection API the views use, over a sync collection."""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def find(self, *args, **kwargs):
+        return SyncBackedCursor(self._collection.find(*args, **kwargs))
+
+    async def aggregate(self, *args, **kwargs):
+        return SyncBackedCursor(self._collection.aggregate(*args, **kwargs))
+
+    async def find_one(self, *args, **kwargs):
+        return self._collection.find_one(*args, **kwargs)
+
+    async def count_documents(self, *args, **kwargs):
+        return self._collection.count_documents(*args, **kwargs)
+
+
+class SyncBackedDatabase:
+    def __init__(self, database):
+        self._database = database
+
+    def __getitem__(self, name):
+        return SyncBackedCollection(self._database[name])
+
+
 class MongoDBConnection:
     _instance = None
     _client = None
     _database = None
-    
+    _pid = None
+    _lock = threading.Lock()
+    _async_clients = weakref.WeakKeyDictionary()
+    _async_enabled = False
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
         return cls._instance
-    
-    def __init__(self):
-        if self._client is None:
-            self.connect()
-    
+
+    def client_options(self):
+        mongo_settings = settings.MONGODB_SETTINGS
+        options = {'serverSelectionTimeoutMS': 5000, 'event_listeners': [pool_stats, command_stats]}
+
+        for key, option in CLIENT_OPTIONS.items():
+            if mongo_settings.get(key) is not None:
+                options[option] = mongo_settings[key]
+
+        return options
+
     def connect(self):
         try:
             mongo_settings = settings.MONGODB_SETTINGS
-            
-            self._client = MongoClient(
-                mongo_settings['host'],
-                serverSelectionTimeoutMS=5000
-            )
-            
+
+            # A client inherited across fork() must not be used or closed in the child.
+            pool_stats.reset()
+            self._client = MongoClient(mongo_settings['host'], **self.client_options())
+
             db_name = mongo_settings['db']
             self._database = self._client[db_name]
-            
-            self._client.server_info()
-            logger.info(f"MongoDB connection established successfully to {mongo_settings['host']}")
+            self._pid = os.getpid()
+
+            # No ping here: pymongo connects in the background and the first
+            # real operation reports an unreachable server.
+            logger.info(f"MongoDB client created for {mongo_settings['host']} (pid {self._pid})")
         except Exception as e:
-            logger.error(f"Failed to connect to MongoDB: {str(e)}")
+            self._database = None
+            logger.error(f"Failed to create MongoDB client: {str(e)}")
             raise
-    
+
+    def close(self):
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                self._client.close()
+            self._client = None
+            self._database = None
+
     @property
     def database(self):
-        if self._database is None:
-            self.connect()
+        if self._database is None or self._pid != os.getpid():
+            with self._lock:
+                if self._database is None or self._pid != os.getpid():
+                    self.connect()
         return self._database
 
-mongodb = MongoDBConnection()
\ No newline at end of file
+    def enable_async_client(self):
+        # Called by the ASGI entry point, whose event loop lives as long as the worker.
+        self._async_enabled = True
+
+    @property
+    def async_database(self):
+        if not self._async_enabled:
+            # Under WSGI every async view runs on a throwaway event loop, and a
+            # client per loop would leak a connection pool per request. The
+            # request owns its thread there, so the sync client (and its one
+            # pool) serves the async views without blocking anyone else.
+            return SyncBackedDatabase(self.database)
+
+        # Async clients are bound to the event loop they were created on,
+        # so each loop (one per ASGI worker) gets its own client.
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+
+        if client is None:
+            mongo_settings = settings.MONGODB_SETTINGS
+            client = AsyncMongoClient(mongo_settings['host'], **self.client_options())
+            self._async_clients[loop] = client
+
+        return client[settings.MONGODB_SETTINGS['db']]
+
+    def supports_transactions(self):
+        # Multi-document transactions need a replica set or a sharded cluster.
+        # The topology is only known once the client has talked to a server.
+        topology = self.database.client.topology_description
+        return topology.topology_type_name in TRANSACTION_TOPOLOGIES
+
+    def pool_stats(self):
+        return pool_stats.snapshot()
+
+mongodb = MongoDBConnection()
@@ -0,0 +1,124 @@
+import contextvars
+import threading
+from collections import defaultdict
+
+from pymongo import monitoring
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Keeps running connection pool counters per server address."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = defaultdict(self._empty)
+
+    @staticmethod
+    def _empty():
+        return {
+            'open_connections': 0,
+            'checked_out': 0,
+            'max_checked_out': 0,
+            'checkouts': 0,
+            'checkout_failures': 0,
+            'total_wait_ms': 0.0,
+            'max_wait_ms': 0.0,
+            'pool_cleared': 0,
+        }
+
+    def _update(self, event, **changes):
+        address = '%s:%s' % event.address
+        with self._lock:
+            stats = self._stats[address]
+            for key, delta in changes.items():
+                stats[key] += delta
+            stats['max_checked_out'] = max(stats['max_checked_out'], stats['checked_out'])
+            return stats
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = {}
+            for address, stats in self._stats.items():
+                stats = dict(stats)
+                stats['avg_wait_ms'] = stats['total_wait_ms'] / stats['checkouts'] if stats['checkouts'] else 0.0
+                snapshot[address] = stats
+            return snapshot
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def pool_created(self, event):
+        self._update(event)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._update(event, pool_cleared=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._update(event, open_connections=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(event, open_connections=-1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._update(event, checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        wait_ms = (event.duration or 0) * 1000
+        stats = self._update(event, checked_out=1, checkouts=1, total_wait_ms=wait_ms)
+        with self._lock:
+            stats['max_wait_ms'] = max(stats['max_wait_ms'], wait_ms)
+
+    def connection_checked_in(self, event):
+        self._update(event, checked_out=-1)
+
+
+pool_stats = PoolStatsListener()
+
+
+# The recorder of the request (or test block) being served, if any.
+active_recorder = contextvars.ContextVar('active_recorder', default=None)
+
+
+class CommandStatsListener(monitoring.CommandListener):
+    """Reports each command's collection, name and duration to the active recorder."""
+
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        recorder = active_recorder.get()
+        if recorder is None:
+            return
+
+        target = event.command.get(event.command_name)
+        if not isinstance(target, str):
+            # getMore carries a cursor id here and names the collection separately.
+            target = event.command.get('collection', event.database_name)
+        self._pending[(event.connection_id, event.request_id)] = (recorder, target)
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is not None:
+            recorder, target = pending
+            recorder.add('mongo', target, event.command_name, event.duration_micros / 1000, failed)
+
+
+command_stats = CommandStatsListener()
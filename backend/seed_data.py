@@ -4,7 +4,7 @@ import django
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "honey_site.settings")  
 django.setup()
 
-from honey_api.mongo_models import CategoryManager, ProductManager, ReviewManager, CartManager, OrderManager
+from honey_api.mongo_models import CategoryManager, ProductManager, ReviewManager, CartManager, OrderManager, UserStatsManager
 from datetime import datetime
 
 # Constants
@@ -17,6 +17,7 @@ products = ProductManager()
 reviews = ReviewManager()
 carts = CartManager()
 orders = OrderManager()
+user_stats = UserStatsManager()
 
 # Clear collections
 categories.collection.delete_many({})
@@ -24,6 +25,9 @@ products.collection.delete_many({})
 reviews.collection.delete_many({})
 carts.collection.delete_many({})
 orders.collection.delete_many({})
+user_stats.collection.delete_many({})
+# Slug counters would otherwise hand the reseeded products suffixed slugs.
+products.collection.database["slug_counters"].delete_many({})
 
 now = datetime.now()
 
@@ -57,14 +61,15 @@ product_list = [
     {"title": "Mini Honey Comb", "category": "Honey Comb", "price": 9.99, "description": "Small portion of honey comb for tasting"},
 ]
 
-for p in product_list:
-    cat_id = category_ids[p["category"]]
-    products.create_product(p["title"], cat_id, p["price"], p["description"])
+products.create_products([
+    {"title": p["title"], "category_id": category_ids[p["category"]], "price": p["price"], "description": p["description"]}
+    for p in product_list
+])
 
 # --- Reviews ---
 reviews_data = [
     {"slug": "wildflower-raw-honey", "rating": 5, "comment": "Absolutely delicious! Best honey I've ever tasted."},
-    {"slug": "wildflower-raw-honey", "rating": 4, "comment": "Great quality honey, fast delivery."},
+    {"slug": "clover-raw-honey", "rating": 4, "comment": "Great quality honey, fast delivery."},
     {"slug": "manuka-honey", "rating": 5, "comment": "Premium taste, worth the price."},
     {"slug": "cinnamon-infused-honey", "rating": 5, "comment": "The cinnamon flavor is perfect, not too strong."},
     {"slug": "lavender-honey", "rating": 4, "comment": "Nice lavender aroma, very smooth."},
@@ -76,35 +81,27 @@ reviews_data = [
 for r in reviews_data:
     reviews.create_review(USER_ID, r["slug"], r["rating"], r["comment"])
 
-# --- Cart ---
-carts.create_cart(USER_ID)
-
 # --- Orders ---
+# Placed through checkout, so totals, stock and user stats come out as for a shopper.
 order_list = [
-    {
-        "items": [
-            {"product_slug": "clover-raw-honey", "quantity": 2, "price": 10.99},
-            {"product_slug": "cinnamon-infused-honey", "quantity": 1, "price": 15.99},
-        ],
-        "total_amount": 37.97
-    },
-    {
-        "items": [
-            {"product_slug": "organic-forest-honey", "quantity": 1, "price": 18.99},
-            {"product_slug": "acacia-honey", "quantity": 1, "price": 19.99},
-        ],
-        "total_amount": 38.98
-    },
-    {
-        "items": [
-            {"product_slug": "honey-comb-piece", "quantity": 1, "price": 25.99},
-            {"product_slug": "mini-honey-comb", "quantity": 3, "price": 9.99},
-        ],
-        "total_amount": 55.96
-    }
+    [
+        {"product_slug": "clover-raw-honey", "quantity": 2, "price": 10.99},
+        {"product_slug": "cinnamon-infused-honey", "quantity": 1, "price": 15.99},
+    ],
+    [
+        {"product_slug": "organic-forest-honey", "quantity": 1, "price": 18.99},
+        {"product_slug": "acacia-honey", "quantity": 1, "price": 19.99},
+    ],
+    [
+        {"product_slug": "honey-comb-piece", "quantity": 1, "price": 25.99},
+        {"product_slug": "mini-honey-comb", "quantity": 3, "price": 9.99},
+    ],
 ]
 
-for o in order_list:
-    orders.create_order(USER_ID, o["items"], o["total_amount"], ADDRESS_ID)
+for number, items in enumerate(order_list, 1):
+    for item in items:
+        carts.add_item(USER_ID, item["product_slug"], item["quantity"], item["price"])
+    cart = carts.get_or_empty(USER_ID)
+    orders.place_order(USER_ID, cart["_id"], ADDRESS_ID, f"seed-order-{number}")
 
 print("Seed data inserted successfully!")